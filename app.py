@@ -1,16 +1,49 @@
 import os
-from fastapi import FastAPI, HTTPException
-from wcg.core.generator import CodeExtractorFactory
-from wcg.core.data_models import QueryRequest
+import json
+import asyncio
+import logging
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from wcg.core.generator import (
+    CodeExtractorFactory,
+    extract_batch,
+    RESULT_CACHE,
+    call_result_cache,
+    IN_FLIGHT,
+)
+from wcg.utils.index import INDEX_BUILDS, get_cache
+from wcg.utils.chunking import CHUNKING_STRATEGIES, pool_stats
+from wcg.ai.embedding_cache import get_embedding_cache
+from wcg.ai.providers import close_http_client, provider_stats
+from wcg.core.data_models import QueryRequest, BatchQueryRequest, PageQueryRequest
+from wcg.core.pages import PAGES, PageTooLarge, decode_page_body, read_page_body
+from wcg.core.warmup import WARMUP, warm_up
+from wcg.utils.executor import run_blocking
+from wcg.utils.metrics import render_metrics, request_span, start_trace
 from dotenv import load_dotenv
 
 dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(dotenv_path=dotenv_path)
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so /healthz answers while models load.
+    warmup_task = asyncio.ensure_future(warm_up())
+    yield
+    warmup_task.cancel()
+    await close_http_client()
+
+
 app = FastAPI(
     title="Code Extraction API",
     description="API for extracting code from HTML using AI and non-AI methods",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -18,12 +51,195 @@ app = FastAPI(
 async def query_endpoint(request: QueryRequest):
     """
     Extract code from HTML based on a given query.
+
+    With debug set, per-stage timings are returned under "trace".
+    """
+    logger.debug(f"Query: {request.query}")
+    trace = start_trace()
+    try:
+        with request_span("query"):
+            extractor = CodeExtractorFactory.get_extractor(request)
+            extracted_code = await extractor.extract_code()
+    except Exception as e:
+        logger.error(f"Error extracting code: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    response = {"result": extracted_code, "metadata": extractor.metadata}
+    if request.debug:
+        response["trace"] = trace
+    return response
+
+
+def format_sse(event: str, data) -> str:
+    """Formats a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream", summary="Stream code extracted from HTML")
+async def query_stream_endpoint(request: QueryRequest):
     """
-    print(f"Query: {request.query}")
+    Stream LLM tokens and extracted code lines as server-sent events.
+    """
+    logger.debug(f"Streaming query: {request.query}")
     extractor = CodeExtractorFactory.get_extractor(request)
+
+    async def event_stream():
+        trace = start_trace()
+        try:
+            with request_span("query_stream"):
+                async for event, data in extractor.stream_code():
+                    yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming code: {e}")
+            yield format_sse("error", str(e))
+            return
+        if request.debug:
+            yield format_sse("trace", trace)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.post("/query/batch", summary="Extract code for several queries on one page")
+async def query_batch_endpoint(request: BatchQueryRequest):
+    """
+    Run several queries against the same HTML, indexing the page only once.
+    """
+    logger.debug(f"Batch query: {len(request.queries)} queries")
+    trace = start_trace()
     try:
-        extracted_code = await extractor.extract_code()
-        return {"result": extracted_code}
+        with request_span("query_batch"):
+            results = await extract_batch(request)
     except Exception as e:
-        print(f"Error extracting code: {e}")
+        logger.error(f"Error extracting batch: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    response = {"results": results}
+    if request.debug:
+        response["trace"] = trace
+    return response
+
+
+@app.post("/pages", status_code=202, summary="Upload a page to query repeatedly")
+async def upload_page_endpoint(
+    request: Request,
+    prune_html: bool = True,
+    chunking: str = "lines",
+    base_page_id: Optional[str] = None,
+):
+    """
+    Store the HTML sent as the request body (raw, or gzip/zstd with a matching
+    Content-Encoding) and start indexing it. Returns the page id to query.
+
+    Pass the id of an earlier upload of the same page as `base_page_id` to
+    re-index incrementally: unchanged chunks keep their tokens and embeddings,
+    and the page is indexed with the base page's settings.
+    """
+    if chunking not in CHUNKING_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown chunking: {chunking}")
+    base = None
+    if base_page_id is not None:
+        base = PAGES.get(base_page_id)
+        if base is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired base page")
+    try:
+        html_content = await run_blocking(
+            decode_page_body,
+            await read_page_body(request),
+            request.headers.get("content-encoding"),
+        )
+    except PageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if not html_content.strip():
+        raise HTTPException(status_code=400, detail="Empty page")
+    page = await PAGES.add(html_content, prune_html, chunking, base)
+    return page.describe()
+
+
+@app.get("/pages/{page_id}", summary="Status of an uploaded page")
+async def page_status_endpoint(page_id: str):
+    page = PAGES.get(page_id)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired page")
+    return page.describe()
+
+
+@app.delete("/pages/{page_id}", summary="Drop an uploaded page")
+async def delete_page_endpoint(page_id: str):
+    if PAGES.remove(page_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired page")
+    return {"page_id": page_id, "deleted": True}
+
+
+@app.post("/pages/{page_id}/query", summary="Extract code from an uploaded page")
+async def page_query_endpoint(page_id: str, request: PageQueryRequest):
+    """
+    Extract code from a page uploaded with POST /pages, reusing its index.
+    Waits for indexing to finish if it is still running.
+    """
+    logger.debug(f"Page query: {page_id} {request.query}")
+    page = await PAGES.get_ready(page_id)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired page")
+    if page.error is not None:
+        raise HTTPException(status_code=500, detail=page.error)
+    trace = start_trace()
+    try:
+        with request_span("page_query"):
+            extractor = CodeExtractorFactory.get_extractor(
+                request.to_query_request(
+                    page.html_content, page.prune_html, page.chunking
+                ),
+                index_entry=page.entry,
+            )
+            extracted_code = await extractor.extract_code()
+    except Exception as e:
+        logger.error(f"Error extracting code: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    response = {"result": extracted_code, "metadata": extractor.metadata}
+    if request.debug:
+        response["trace"] = trace
+    return response
+
+
+@app.get("/cache/stats", summary="Cache hit rates")
+async def cache_stats_endpoint():
+    """
+    Report hit/miss statistics for the index, result and embedding caches.
+    """
+    embedding_cache = get_embedding_cache()
+    return {
+        "index": get_cache("index").stats(),
+        "results": await call_result_cache(RESULT_CACHE.stats),
+        "embeddings": embedding_cache.stats() if embedding_cache else None,
+        "chunking_pool": pool_stats(),
+        "providers": provider_stats(),
+        "coalescing": IN_FLIGHT.stats(),
+        "index_builds": INDEX_BUILDS.stats(),
+        "pages": PAGES.stats(),
+    }
+
+
+@app.get("/healthz", summary="Liveness probe")
+async def healthz_endpoint():
+    return {"status": "ok"}
+
+
+@app.get("/readyz", summary="Readiness probe")
+async def readyz_endpoint():
+    """
+    Report 200 once models, clients and the chunking grammar are preloaded,
+    and 503 while the startup warm-up is still running or a required step
+    failed. Failed optional steps are reported with status "degraded".
+    """
+    ready = WARMUP.ready and WARMUP.healthy
+    return JSONResponse(WARMUP.describe(), status_code=200 if ready else 503)
+
+
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Expose stage latency histograms, chunk and prompt sizes and cache events.
+    """
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,45 @@
+"""Regression check for the DOM fast path over the bundled test corpus.
+
+Runs every tasks.csv query through match_query and fails when the fast path
+types a value other than the one the query asked for:
+
+    python -m benchmarks.check_fast_path
+"""
+import sys
+
+from benchmarks.run_benchmark import DEFAULT_DIRECTORIES, load_cases
+from wcg.utils.fast_path import match_query
+
+# Values the fast path must type for these queries; None means the query has
+# to be left to the LLM. Any other query must not be answered by typing.
+EXPECTED_VALUES = {
+    "search for the word huggigface": "huggigface",
+    "search for the model mistralai/Mistral-7B-Instruct-v0.2": None,
+    'type in the search query "Einstein" in the search box': "Einstein",
+}
+
+
+def check(cases: list) -> list:
+    """Returns a description of every case the fast path got wrong."""
+    failures = []
+    for case in cases:
+        query = case["query"].strip()
+        match = match_query(case["html"], query)
+        value = match.value if match is not None else None
+        if query in EXPECTED_VALUES:
+            if value != EXPECTED_VALUES[query]:
+                failures.append(
+                    f"{case['page']}: {query!r} typed {value!r}, "
+                    f"expected {EXPECTED_VALUES[query]!r}"
+                )
+        elif value is not None:
+            failures.append(f"{case['page']}: {query!r} unexpectedly typed {value!r}")
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check(load_cases(DEFAULT_DIRECTORIES))
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} fast path regressions")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,109 @@
+import re
+import time
+import zlib
+import asyncio
+from typing import Any, List
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+from wcg.utils.index import get_cache
+
+FAKE_EMBED_DIM = 384
+
+id_re = re.compile(r'\bid="([A-Za-z][\w-]*)"')
+word_re = re.compile(r"[a-z0-9]+")
+
+
+class FakeLLM(CustomLLM):
+    """Deterministic LLM that answers with a click on the last element id in the prompt.
+
+    The prompt ends with the retrieved context, so the answer depends on what
+    retrieval returned. `latency` seconds are slept per call to model the
+    provider round trip.
+    """
+
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm")
+
+    def _answer(self, prompt: str) -> str:
+        ids = id_re.findall(prompt)
+        element_id = ids[-1] if ids else "missing"
+        if "```python" in prompt:
+            code = f'driver.find_element(By.XPATH, "//*[@id=\'{element_id}\']").click()'
+            return f"```python\n{code}\n```"
+        return f"```javascript\ndocument.querySelector('#{element_id}').click();\n```"
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        time.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        answer = self._answer(prompt)
+        tokens = answer.splitlines(keepends=True)
+
+        def gen():
+            text = ""
+            for token in tokens:
+                time.sleep(self.latency / len(tokens))
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Deterministic hashed bag-of-words embedding, so dense retrieval stays meaningful offline."""
+
+    embed_dim: int = FAKE_EMBED_DIM
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in word_re.findall(text.lower()):
+            vector[zlib.crc32(word.encode()) % self.embed_dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+def install_fakes(
+    embedding_model: str, llm_type: str, llm_model: str, llm_latency: float = 0.0
+):
+    """Seeds the model caches so requests with these settings use the fakes."""
+    embed_model = FakeEmbedding(model_name=embedding_model)
+    get_cache("embedding")[embedding_model] = embed_model
+    get_cache("llm")[f"{llm_type}_{llm_model}"] = FakeLLM(latency=llm_latency)
+    Settings.embed_model = embed_model
@@ -0,0 +1,418 @@
+"""Offline latency and throughput benchmark over the bundled test corpus.
+
+Runs every (page, task) row of the task CSVs through the extraction pipeline
+with a deterministic fake LLM and embedder, either in-process or over HTTP,
+and prints a JSON report that can be diffed between runs:
+
+    python -m benchmarks.run_benchmark --concurrency 8 --repeat 3 --output before.json
+    python -m benchmarks.run_benchmark --http --concurrency 8
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import resource
+import threading
+import platform
+
+import numpy as np
+
+from benchmarks.fakes import install_fakes
+from wcg.core.data_models import QueryRequest
+from wcg.core.generator import CodeExtractorFactory
+from wcg.utils.metrics import start_trace
+
+DEFAULT_DIRECTORIES = ["test/task1", "test/task2", "test/individual_tasks"]
+FAKE_LLM_TYPE = "fake"
+FAKE_LLM_MODEL = "fake-llm"
+
+bucket_line_re = re.compile(
+    r'^(?P<name>\w+)_bucket\{(?P<label>\w+)="(?P<value>[^"]*)",le="(?P<le>[^"]+)"\} (?P<count>\S+)$'
+)
+sum_count_line_re = re.compile(
+    r'^(?P<name>\w+)_(?P<field>sum|count)\{(?P<label>\w+)="(?P<value>[^"]*)"\} (?P<number>\S+)$'
+)
+
+
+def load_cases(directories: list) -> list:
+    """Reads (page, query) rows from each directory's tasks.csv."""
+    cases = []
+    for directory in directories:
+        with open(os.path.join(directory, "tasks.csv"), encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            for row in reader:
+                if len(row) < 2 or not row[1].strip():
+                    continue
+                page = os.path.join(directory, row[0].strip())
+                with open(page, encoding="utf-8") as html_file:
+                    html_content = html_file.read()
+                cases.append(
+                    {"page": page, "query": row[1].strip(), "html": html_content}
+                )
+    return cases
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 6),
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p95": round(float(np.percentile(values, 95)), 6),
+        "p99": round(float(np.percentile(values, 99)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+
+def parse_histograms(text: str) -> dict:
+    """Parses Prometheus text into {(metric, label value): {"buckets", "sum", "count"}}."""
+    histograms = {}
+    for line in text.splitlines():
+        match = bucket_line_re.match(line)
+        if match:
+            series = histograms.setdefault(
+                (match["name"], match["value"]), {"buckets": {}, "sum": 0.0, "count": 0}
+            )
+            series["buckets"][float(match["le"])] = float(match["count"])
+            continue
+        match = sum_count_line_re.match(line)
+        if match:
+            series = histograms.setdefault(
+                (match["name"], match["value"]), {"buckets": {}, "sum": 0.0, "count": 0}
+            )
+            series[match["field"]] = float(match["number"])
+    return histograms
+
+
+def histogram_quantile(buckets: dict, count: float, quantile: float) -> float:
+    """Estimates a quantile by linear interpolation inside its bucket, as Prometheus does."""
+    rank = quantile * count
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, cumulative in sorted(buckets.items()):
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if cumulative == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (
+                cumulative - lower_count
+            )
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+
+def summarize_histograms(before: dict, after: dict, metric: str) -> dict:
+    """Summarizes what one server histogram recorded between two scrapes, per label."""
+    summaries = {}
+    for (name, label_value), series in sorted(after.items()):
+        if name != metric:
+            continue
+        previous = before.get((name, label_value), {"buckets": {}, "sum": 0.0, "count": 0})
+        count = series["count"] - previous["count"]
+        if count <= 0:
+            continue
+        buckets = {
+            bound: cumulative - previous["buckets"].get(bound, 0.0)
+            for bound, cumulative in series["buckets"].items()
+        }
+        summaries[label_value] = {
+            "count": int(count),
+            "mean": round((series["sum"] - previous["sum"]) / count, 6),
+            **{
+                f"p{int(quantile * 100)}": round(
+                    histogram_quantile(buckets, count, quantile), 6
+                )
+                for quantile in (0.5, 0.95, 0.99)
+            },
+        }
+    return summaries
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1
+        ),
+    }
+
+
+def request_payloads(cases: list, settings: dict, repeat: int) -> list:
+    payloads = []
+    for _ in range(repeat):
+        for case in cases:
+            for prompt_template in settings["prompt_templates"]:
+                payloads.append(
+                    {
+                        "page": case["page"],
+                        "query": case["query"],
+                        "html_content": case["html"],
+                        "prompt_template": prompt_template,
+                        **settings["request"],
+                    }
+                )
+    return payloads
+
+
+async def run_in_process(payload: dict) -> dict:
+    trace = start_trace()
+    request = QueryRequest(**{k: v for k, v in payload.items() if k != "page"})
+    extractor = CodeExtractorFactory.get_extractor(request)
+    result = await extractor.extract_code()
+    return {"result": result, "metadata": extractor.metadata, "trace": trace}
+
+
+def http_client(base_url: str):
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return httpx.AsyncClient(base_url=base_url, timeout=None)
+
+
+async def scrape_histograms(client) -> dict:
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    return parse_histograms(response.text)
+
+
+def http_runner(client):
+
+    async def run(payload: dict) -> dict:
+        response = await client.post(
+            "/query", json={k: v for k, v in payload.items() if k != "page"}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    return run
+
+
+async def drive(run, payloads: list, concurrency: int) -> (list, float):
+    """Runs payloads with at most `concurrency` in flight; returns samples and wall time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(payload):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await run(payload)
+                error = None
+            except Exception as e:
+                response, error = {}, f"{type(e).__name__}: {e}"
+            return {
+                "page": payload["page"],
+                "query": payload["query"],
+                "latency": time.perf_counter() - start,
+                "response": response,
+                "error": error,
+            }
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*[one(payload) for payload in payloads])
+    return samples, time.perf_counter() - start
+
+
+def build_report(
+    samples: list, wall_seconds: float, config: dict, server_metrics: tuple = None
+) -> dict:
+    """Summarizes the samples into the JSON report.
+
+    Over HTTP, stage timings and page chunk counts come from the server's
+    /metrics, scraped before and after the measured run.
+    """
+    stages = {}
+    chunks = {"page": [], "retrieved": [], "prompt": []}
+    prompt_tokens = []
+    paths = {}
+    for sample in samples:
+        response = sample["response"]
+        trace = response.get("trace") or {}
+        metadata = response.get("metadata") or {}
+        for stage, seconds in trace.get("timings", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+        if "page_chunks" in trace:
+            chunks["page"].append(trace["page_chunks"])
+        if "retrieved_chunks" in metadata:
+            chunks["retrieved"].append(metadata["retrieved_chunks"])
+            chunks["prompt"].append(metadata["prompt_chunks"])
+            prompt_tokens.append(metadata["prompt_tokens"])
+        path = metadata.get("path", "error" if sample["error"] else "unknown")
+        paths[path] = paths.get(path, 0) + 1
+
+    completed = [sample for sample in samples if sample["error"] is None]
+    errors = [
+        {"page": sample["page"], "query": sample["query"], "error": sample["error"]}
+        for sample in samples
+        if sample["error"] is not None
+    ]
+    return {
+        "config": config,
+        "requests": len(samples),
+        "errors": len(errors),
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(completed) / wall_seconds, 3)
+        if wall_seconds
+        else None,
+        "latency": summarize([sample["latency"] for sample in completed]),
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())}
+        if server_metrics is None
+        else summarize_histograms(*server_metrics, "wcg_stage_duration_seconds"),
+        "paths": paths,
+        "chunks": {
+            **{kind: summarize(values) for kind, values in chunks.items()},
+            **(
+                {}
+                if server_metrics is None
+                else {
+                    "page": summarize_histograms(*server_metrics, "wcg_chunks").get(
+                        "page", {"count": 0}
+                    )
+                }
+            ),
+        },
+        "prompt_tokens": summarize(prompt_tokens),
+        "peak_rss_mb": peak_rss_mb(),
+        "error_samples": errors[:10],
+    }
+
+
+def start_server(port: int):
+    """Serves the app with the fakes installed on a background thread."""
+    import uvicorn
+    from app import app
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directories", nargs="+", default=DEFAULT_DIRECTORIES)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--warmup", type=int, default=0, help="Unmeasured passes over the corpus."
+    )
+    parser.add_argument(
+        "--prompt-templates", nargs="+", default=["js"], choices=["js", "selenium"]
+    )
+    parser.add_argument(
+        "--retriever-mode", default="bm25", choices=["bm25", "dense", "hybrid"]
+    )
+    parser.add_argument("--chunking", default="lines", choices=["lines", "dom"])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--no-prune", action="store_true")
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument(
+        "--use-cache", action="store_true", help="Serve repeats from the result cache."
+    )
+    parser.add_argument(
+        "--embedding-model",
+        default="BAAI/bge-small-en-v1.5",
+        help="Name the fake embedder is registered under.",
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call."
+    )
+    parser.add_argument(
+        "--http", action="store_true", help="Serve the app locally and query it over HTTP."
+    )
+    parser.add_argument(
+        "--url",
+        help="Benchmark an already running server instead, with its default LLM.",
+    )
+    parser.add_argument("--output", help="Write the JSON report here too.")
+    return parser.parse_args(argv)
+
+
+async def main(argv: list) -> dict:
+    args = parse_args(argv)
+    settings = {
+        "prompt_templates": args.prompt_templates,
+        "request": {
+            "extractor_type": "non-ai",
+            "top_k": args.top_k,
+            "use_local_embeddings": True,
+            "embedding_model": args.embedding_model,
+            "retriever_mode": args.retriever_mode,
+            "chunking": args.chunking,
+            "prune_html": not args.no_prune,
+            "fast_path": not args.no_fast_path,
+            "use_cache": args.use_cache,
+        },
+    }
+    if not args.url:
+        # A remote server answers with its own default LLM and embedder.
+        install_fakes(
+            args.embedding_model, FAKE_LLM_TYPE, FAKE_LLM_MODEL, args.llm_latency
+        )
+        settings["request"].update(llm_type=FAKE_LLM_TYPE, llm_model=FAKE_LLM_MODEL)
+    cases = load_cases(args.directories)
+
+    client = None
+    server = None
+    server_metrics = None
+    if args.url or args.http:
+        if args.http:
+            port = free_port()
+            server, _ = start_server(port)
+            base_url = f"http://127.0.0.1:{port}"
+        else:
+            base_url = args.url
+        client = http_client(base_url)
+        run = http_runner(client)
+    else:
+        run = run_in_process
+
+    try:
+        if args.warmup:
+            await drive(
+                run, request_payloads(cases, settings, args.warmup), args.concurrency
+            )
+        before = await scrape_histograms(client) if client is not None else None
+        samples, wall_seconds = await drive(
+            run, request_payloads(cases, settings, args.repeat), args.concurrency
+        )
+        if client is not None:
+            server_metrics = (before, await scrape_histograms(client))
+    finally:
+        if client is not None:
+            await client.aclose()
+        if server is not None:
+            server.should_exit = True
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    config["mode"] = "http" if (args.http or args.url) else "in-process"
+    config["cases"] = len(cases)
+    report = build_report(samples, wall_seconds, config, server_metrics)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main(sys.argv[1:])), indent=2))
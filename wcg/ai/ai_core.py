@@ -1,9 +1,18 @@
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI as SyncOpenAI
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.llms.openai import OpenAI
 from llama_index.llms.together import TogetherLLM
 from llama_index.llms.ollama import Ollama
 
+from wcg.ai.embeddings import EMBED_BATCH_SIZE, EMBED_MAX_LENGTH
+from wcg.ai.providers import (
+    PROVIDER_TIMEOUT,
+    get_http_client,
+    get_limiter,
+    get_sync_http_client,
+)
+
 
 class SingletonMeta(type):
     _instances = {}
@@ -14,14 +23,56 @@ class SingletonMeta(type):
         return cls._instances[cls]
 
 
+class SharedPoolMixin:
+    """Builds a llama-index OpenAI-style LLM's SDK clients over the shared pools.
+
+    llama-index would hand one http_client to both its sync and async clients,
+    which httpx cannot serve, so the clients are built here instead. Building
+    them per call is cheap and always picks up the current pools.
+    """
+
+    def _get_client(self) -> SyncOpenAI:
+        return SyncOpenAI(
+            **{**self._get_credential_kwargs(), "http_client": get_sync_http_client()}
+        )
+
+    def _get_aclient(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            **{**self._get_credential_kwargs(), "http_client": get_http_client()}
+        )
+
+
+class PooledOpenAI(SharedPoolMixin, OpenAI):
+    pass
+
+
+class PooledTogetherLLM(SharedPoolMixin, TogetherLLM):
+    pass
+
+
 class AIExtractorClient(metaclass=SingletonMeta):
     def __init__(self):
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self._client = None
+        self._http_client = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Rebuilt when the shared pool was closed and reopened.
+        http_client = get_http_client()
+        if self._client is None or self._http_client is not http_client:
+            # Retries are handled by the provider limiter, not by the client.
+            self._client = AsyncOpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                http_client=http_client,
+                max_retries=0,
+            )
+            self._http_client = http_client
+        return self._client
 
     async def extract_code(self, result: str) -> str:
         """Uses OpenAI to extract and format code from the given text."""
-        print("Extracting code with AI")
-        response = self.client.chat.completions.create(
+        response = await get_limiter("openai").call(
+            self.client.chat.completions.create,
             model="gpt-3.5-turbo",
             messages=[
                 {
@@ -41,7 +92,11 @@ class EmbeddingFactory(metaclass=SingletonMeta):
     def get_embedding(self, model_name: str) -> HuggingFaceEmbedding:
         """Retrieve or create an embedding model based on the model name."""
         if model_name not in self._embeddings:
-            self._embeddings[model_name] = HuggingFaceEmbedding(model_name=model_name)
+            self._embeddings[model_name] = HuggingFaceEmbedding(
+                model_name=model_name,
+                max_length=EMBED_MAX_LENGTH,
+                embed_batch_size=EMBED_BATCH_SIZE,
+            )
         return self._embeddings[model_name]
 
 
@@ -66,10 +121,21 @@ class LLMFactory(metaclass=SingletonMeta):
                 f"Model '{model}' is not available for LLM type '{llm_type}'."
             )
 
+        # OpenAI-style LLMs share the provider connection pools; retries and
+        # concurrency limits are applied around synthesis by the provider limiter.
+        # OpenAI is built here rather than left to the Settings.llm default so
+        # that llm_model, the timeout and the shared pools apply to it as well.
         if llm_type == "together":
-            print("Creating TogetherLLM", model)
-            return TogetherLLM(model=model, api_key=api_key)
+            return PooledTogetherLLM(
+                model=model, api_key=api_key, timeout=PROVIDER_TIMEOUT, max_retries=0
+            )
         elif llm_type == "ollama":
-            return Ollama(model=model, request_timeout=30.0)
+            # Ollama opens a client per call and takes no injected one; it is
+            # usually a local server, so connection setup is cheap.
+            return Ollama(model=model, request_timeout=PROVIDER_TIMEOUT)
+        elif llm_type == "openai":
+            return PooledOpenAI(
+                model=model, api_key=api_key, timeout=PROVIDER_TIMEOUT, max_retries=0
+            )
         else:
             return None
@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import numpy as np
+
+from wcg.utils.cache import content_hash
+
+# Path of the SQLite embedding store; the cache is disabled when unset.
+EMBEDDING_CACHE_PATH = os.environ.get("WCG_EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_MAX_ROWS = int(os.environ.get("WCG_EMBEDDING_CACHE_MAX_ROWS", 200000))
+
+# SQLite limits the number of bound parameters per statement.
+_LOOKUP_BATCH = 500
+
+whitespace_re = re.compile(r"\s+")
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def chunk_text_hash(text: str) -> str:
+    """Hashes chunk text after collapsing whitespace, so reindented markup still hits."""
+    return content_hash(whitespace_re.sub(" ", text).strip())
+
+
+class EmbeddingCache:
+    """Persistent store of chunk embeddings keyed by (model name, chunk text hash).
+
+    Rows are evicted least recently used first once max_rows is exceeded.
+    """
+
+    def __init__(self, path: str, max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, text_hash TEXT, vector BLOB, accessed_at REAL, "
+            "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed_at "
+            "ON embeddings (accessed_at)"
+        )
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model_name: str, text_hashes: list) -> dict:
+        """Returns {text hash: float32 vector} for every cached hash."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(text_hashes), _LOOKUP_BATCH):
+                batch = text_hashes[start : start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model_name, *batch],
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+                self._connection.executemany(
+                    "UPDATE embeddings SET accessed_at = ? "
+                    "WHERE model = ? AND text_hash = ?",
+                    [(now, model_name, text_hash) for text_hash, _ in rows],
+                )
+            self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(set(text_hashes)) - len(found)
+        return found
+
+    def put_many(self, model_name: str, text_hashes: list, matrix: np.ndarray):
+        """Stores one embedding row per text hash and enforces the row limit."""
+        now = time.time()
+        rows = [
+            (model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text_hash, vector in zip(text_hashes, matrix)
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+            )
+            excess = self._count() - self.max_rows
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+                    "SELECT model, text_hash FROM embeddings "
+                    "ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "rows": self._count(),
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the shared embedding cache, or None when WCG_EMBEDDING_CACHE_PATH is unset."""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        return _embedding_cache
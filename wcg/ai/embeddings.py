@@ -0,0 +1,111 @@
+import os
+import numpy as np
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import format_query
+
+from wcg.ai.embedding_cache import chunk_text_hash
+
+EMBED_BATCH_SIZE = int(os.environ.get("WCG_EMBED_BATCH_SIZE", 32))
+EMBED_MAX_LENGTH = int(os.environ.get("WCG_EMBED_MAX_LENGTH", 512))
+# Storage dtype of chunk embedding matrices: float32, float16 or int8.
+EMBED_DTYPE = os.environ.get("WCG_EMBED_DTYPE", "float32")
+
+
+class EmbeddingMatrix:
+    """Row-normalized embeddings stored as float32, float16 or int8 with a scale."""
+
+    __slots__ = ("data", "scale")
+
+    def __init__(self, data: np.ndarray, scale: float = 1.0):
+        self.data = data
+        self.scale = scale
+
+    @classmethod
+    def from_float(
+        cls, matrix: np.ndarray, dtype: str = "float32"
+    ) -> "EmbeddingMatrix":
+        """Quantizes a normalized float matrix into the requested storage dtype."""
+        if dtype == "int8":
+            # Unit-length rows keep every component within [-1, 1].
+            data = np.clip(np.rint(matrix * 127.0), -127, 127).astype(np.int8)
+            return cls(np.ascontiguousarray(data), 1.0 / 127.0)
+        if dtype == "float16":
+            return cls(np.ascontiguousarray(matrix, dtype=np.float16))
+        return cls(np.ascontiguousarray(matrix, dtype=np.float32))
+
+    def __matmul__(self, vector: np.ndarray) -> np.ndarray:
+        scores = self.data @ np.asarray(vector, dtype=np.float32)
+        return scores.astype(np.float32, copy=False) * self.scale
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+
+class EmbeddingService:
+    """Embeds texts and queries in fixed-size batches.
+
+    When an embedding cache is given, text embeddings are looked up by
+    (model_name, chunk text hash) first and only the misses reach the model.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        batch_size: int = EMBED_BATCH_SIZE,
+        model_name: str = None,
+        cache=None,
+    ):
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        self.model_name = model_name
+        self.cache = cache if model_name else None
+
+    def embed_texts(self, texts: list) -> np.ndarray:
+        """Returns a float32 matrix with one row per text."""
+        if self.cache is None:
+            return self._batched(self.embed_model._get_text_embeddings, texts)
+
+        text_hashes = [chunk_text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, list(set(text_hashes)))
+        missing = {}
+        for text, text_hash in zip(texts, text_hashes):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            embedded = self._batched(
+                self.embed_model._get_text_embeddings, list(missing.values())
+            )
+            self.cache.put_many(self.model_name, list(missing), embedded)
+            cached.update(zip(missing, embedded))
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([cached[text_hash] for text_hash in text_hashes])
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        """Returns a float32 matrix with one row per query, batching where the model allows."""
+        if isinstance(self.embed_model, HuggingFaceEmbedding):
+            formatted = [
+                format_query(
+                    query,
+                    self.embed_model.model_name,
+                    self.embed_model.query_instruction,
+                )
+                for query in queries
+            ]
+            return self._batched(self.embed_model._embed, formatted)
+        return self._batched(
+            lambda batch: [self.embed_model.get_query_embedding(q) for q in batch],
+            queries,
+        )
+
+    def _batched(self, embed_batch, texts: list) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            rows.extend(embed_batch(texts[start : start + self.batch_size]))
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(rows, dtype=np.float32)
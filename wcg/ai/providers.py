@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed for one LLM request, and for opening its connection.
+PROVIDER_TIMEOUT = float(os.environ.get("WCG_LLM_TIMEOUT", 60))
+PROVIDER_CONNECT_TIMEOUT = float(os.environ.get("WCG_LLM_CONNECT_TIMEOUT", 5))
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get("WCG_LLM_MAX_CONNECTIONS", 100))
+PROVIDER_MAX_KEEPALIVE = int(os.environ.get("WCG_LLM_MAX_KEEPALIVE", 20))
+PROVIDER_MAX_RETRIES = int(os.environ.get("WCG_LLM_MAX_RETRIES", 3))
+PROVIDER_BACKOFF_BASE = float(os.environ.get("WCG_LLM_BACKOFF_BASE", 0.5))
+PROVIDER_BACKOFF_CAP = float(os.environ.get("WCG_LLM_BACKOFF_CAP", 8))
+
+# Concurrent requests, sustained requests per second and burst size per
+# provider; a rate of 0 disables rate limiting.
+PROVIDER_LIMITS = {
+    "openai": {"concurrency": 16, "rate": 8.0, "burst": 16},
+    "together": {"concurrency": 8, "rate": 4.0, "burst": 8},
+    "ollama": {"concurrency": 2, "rate": 0.0, "burst": 1},
+}
+PROVIDER_LIMITS.update(json.loads(os.environ.get("WCG_PROVIDER_LIMITS", "{}")))
+DEFAULT_PROVIDER_LIMITS = {"concurrency": 8, "rate": 0.0, "burst": 1}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_http_client = None
+_sync_http_client = None
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def provider_timeout() -> httpx.Timeout:
+    return httpx.Timeout(PROVIDER_TIMEOUT, connect=PROVIDER_CONNECT_TIMEOUT)
+
+
+def provider_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=PROVIDER_MAX_KEEPALIVE,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared keep-alive connection pool used for async provider calls."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=provider_timeout(), limits=provider_limits()
+        )
+    return _http_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """Returns the shared keep-alive connection pool used for blocking provider calls."""
+    global _sync_http_client
+    if _sync_http_client is None or _sync_http_client.is_closed:
+        _sync_http_client = httpx.Client(
+            timeout=provider_timeout(), limits=provider_limits()
+        )
+    return _sync_http_client
+
+
+async def close_http_client():
+    """Closes both shared pools; the next get_*http_client call opens new ones."""
+    global _http_client, _sync_http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _sync_http_client is not None:
+        _sync_http_client.close()
+        _sync_http_client = None
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for timeouts, dropped connections, rate limiting and server errors."""
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # openai's connection and timeout errors carry no status code.
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(
+        0, min(PROVIDER_BACKOFF_CAP, PROVIDER_BACKOFF_BASE * 2**attempt)
+    )
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` at once."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    async def acquire(self) -> float:
+        """Waits for a token and returns the time spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class ProviderLimiter:
+    """Caps concurrency and request rate for one LLM provider and retries failed calls."""
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        rate: float,
+        burst: int,
+        max_retries: int = PROVIDER_MAX_RETRIES,
+    ):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.active = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one of the provider's concurrency slots after passing the rate limit."""
+        self.throttled_seconds += await self.bucket.acquire()
+        async with self._semaphore:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+    async def retry(self, func, *args, **kwargs):
+        """Awaits func(*args, **kwargs), retrying retryable errors with jittered backoff."""
+        attempt = 0
+        while True:
+            self.calls += 1
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(
+                    f"{self.name} call failed ({e}); retry {attempt + 1} in {delay:.2f}s"
+                )
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def call(self, func, *args, **kwargs):
+        """Like retry, with every attempt holding a concurrency slot."""
+        return await self.retry(self._limited, func, *args, **kwargs)
+
+    async def _limited(self, func, *args, **kwargs):
+        async with self.slot():
+            return await func(*args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Returns the shared limiter of an LLM provider ("openai", "together", "ollama")."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            limits = {**DEFAULT_PROVIDER_LIMITS, **PROVIDER_LIMITS.get(provider, {})}
+            _limiters[provider] = ProviderLimiter(
+                provider, limits["concurrency"], limits["rate"], limits["burst"]
+            )
+        return _limiters[provider]
+
+
+def provider_stats() -> dict:
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
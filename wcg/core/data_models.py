@@ -1,11 +1,20 @@
+import json
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 
+from wcg.utils.cache import content_hash
 
-class QueryRequest(BaseModel):
-    file_path: Optional[str] = Field(None, example="html/1.html")
-    html_content: Optional[str] = Field(None, example="<html>...</html>")
-    query: str = Field(..., example="click on the search box")
+# Fields that do not change the extracted code and are left out of result cache keys.
+RESULT_CACHE_EXCLUDED_FIELDS = {
+    "file_path",
+    "html_content",
+    "streaming",
+    "debug",
+    "use_cache",
+}
+
+
+class QuerySettings(BaseModel):
     top_k: Optional[int] = Field(10, example=10)
     streaming: Optional[bool] = Field(False, example=False)
     prompt_template: Optional[str] = Field("js", example="js")
@@ -18,6 +27,24 @@ class QueryRequest(BaseModel):
     )
     llm_type: Optional[str] = Field("openai", example="openai")
     llm_model: Optional[str] = Field("gpt-3.5-turbo", example="gpt-3.5-turbo")
+    prune_html: Optional[bool] = Field(True, example=True)
+    use_cache: Optional[bool] = Field(True, example=True)
+    retriever_mode: Optional[Literal["bm25", "dense", "hybrid"]] = Field(
+        "bm25", example="hybrid"
+    )
+    chunking: Optional[Literal["lines", "dom"]] = Field("lines", example="dom")
+    fast_path: Optional[bool] = Field(True, example=True)
+
+
+class QueryRequest(QuerySettings):
+    file_path: Optional[str] = Field(None, example="html/1.html")
+    html_content: Optional[str] = Field(None, example="<html>...</html>")
+    query: str = Field(..., example="click on the search box")
+
+    def result_cache_key(self, html_content: str) -> str:
+        """Canonical hash of the page and every setting that affects the result."""
+        settings = self.dict(exclude=RESULT_CACHE_EXCLUDED_FIELDS)
+        return content_hash(html_content, json.dumps(settings, sort_keys=True))
 
     class Config:
         schema_extra = {
@@ -88,3 +115,48 @@ class QueryRequest(BaseModel):
                 },
             }
         }
+
+
+class BatchQueryItem(BaseModel):
+    query: str = Field(..., example="click on the search box")
+    prompt_template: Optional[str] = Field(None, example="selenium")
+    extractor_type: Optional[str] = Field(None, example="non-ai")
+
+
+class BatchQueryRequest(QuerySettings):
+    file_path: Optional[str] = Field(None, example="html/1.html")
+    html_content: Optional[str] = Field(None, example="<html>...</html>")
+    queries: List[BatchQueryItem] = Field(
+        ..., example=[{"query": "click on the search box"}]
+    )
+    concurrency: Optional[int] = Field(4, example=4)
+
+    def to_query_requests(self, html_content: str) -> List[QueryRequest]:
+        """Expands the batch into single requests sharing the page and settings."""
+        settings = self.dict(
+            exclude={"file_path", "html_content", "queries", "concurrency"}
+        )
+        requests = []
+        for item in self.queries:
+            overrides = {k: v for k, v in item.dict().items() if v is not None}
+            requests.append(
+                QueryRequest(**{**settings, **overrides, "html_content": html_content})
+            )
+        return requests
+
+
+class PageQueryRequest(QuerySettings):
+    query: str = Field(..., example="click on the search box")
+
+    def to_query_request(
+        self, html_content: str, prune_html: bool, chunking: str
+    ) -> QueryRequest:
+        """Binds the query to an uploaded page and the settings it was indexed with."""
+        return QueryRequest(
+            **{
+                **self.dict(),
+                "html_content": html_content,
+                "prune_html": prune_html,
+                "chunking": chunking,
+            }
+        )
@@ -1,66 +1,223 @@
 from abc import ABC, abstractmethod
+import os
 import logging
+import asyncio
+from llama_index.core.schema import QueryBundle
 from .data_models import QueryRequest
-from wcg.core.data_models import QueryRequest
+from wcg.core.data_models import QueryRequest, BatchQueryRequest
 from wcg.ai.ai_core import AIExtractorClient
-from wcg.utils.code import extract_first_code_block
+from wcg.utils.code import extract_first_code_block, CodeBlockStream
 from wcg.utils.index import get_query_engine
-from wcg.utils.html import query_html
+from wcg.utils.html import aquery_html, astream_query_html, clean_html
+from wcg.utils.executor import run_blocking
+from wcg.utils.cache import LRUCache, SQLiteCache
+from wcg.utils.fast_path import match_query
+from wcg.utils.singleflight import SingleFlight
+from wcg.utils.metrics import SERVED_BY, observe_cache, span
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 
+def create_result_cache():
+    """Creates the extraction result cache, on disk if WCG_RESULT_CACHE_PATH is set."""
+    max_entries = int(os.environ.get("WCG_RESULT_CACHE_SIZE", 1024))
+    ttl = float(os.environ.get("WCG_RESULT_CACHE_TTL", 3600))
+    path = os.environ.get("WCG_RESULT_CACHE_PATH")
+    if path:
+        return SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    return LRUCache(max_entries=max_entries, ttl=ttl)
+
+
+RESULT_CACHE = create_result_cache()
+# Concurrent extractions of the same result cache key share one run.
+IN_FLIGHT = SingleFlight()
+
+
+async def call_result_cache(method, *args):
+    """Calls a RESULT_CACHE method, off the event loop for the on-disk backend."""
+    if isinstance(RESULT_CACHE, SQLiteCache):
+        return await run_blocking(method, *args)
+    return method(*args)
+
+
 class CodeExtractorFactory:
     @staticmethod
-    def get_extractor(request: QueryRequest):
+    def get_extractor(request: QueryRequest, index_entry=None):
         if request.extractor_type == "ai":
-            return AIExtractor(request)
+            return AIExtractor(request, index_entry)
         else:
-            return NonAIExtractor(request)
+            return NonAIExtractor(request, index_entry)
 
 
 class BaseExtractor(ABC):
-    def __init__(self, request: QueryRequest):
+    def __init__(self, request: QueryRequest, index_entry=None):
         self.request = request
-        self.html_content = self._get_html_content()
+        # Pages given by file_path are read by load_html, off the event loop.
+        self.html_content = request.html_content or None
+        # Prebuilt index of the page, e.g. from the page store.
+        self.index_entry = index_entry
+        # Details about how the result was produced, returned next to it.
+        self.metadata = {}
+        # None until the fast path was tried, then the match or False.
+        self._fast_path = None
+
+    async def extract_code(self, query_engine=None, relevant_parts=None) -> str:
+        """Returns the extracted code, served from the result cache when possible.
+
+        Setting use_cache to False skips the lookup but still stores the fresh result.
+        Identical requests arriving while one is being extracted wait for it
+        instead of extracting again.
+        """
+        await self.load_html()
+        cached = await self.lookup_result()
+        if cached is not None:
+            return cached
+        cache_key = self.request.result_cache_key(self.html_content)
+        outcome, shared = await IN_FLIGHT.do(
+            cache_key, self._extract_and_store, cache_key, query_engine, relevant_parts
+        )
+        if shared:
+            self.metadata.update(outcome["metadata"], coalesced=True)
+        return outcome["result"]
+
+    async def lookup_result(self) -> str:
+        """Returns the cached result if use_cache is set and there is one, else None."""
+        if not self.request.use_cache:
+            return None
+        cached = await call_result_cache(
+            RESULT_CACHE.get, self.request.result_cache_key(self.html_content)
+        )
+        observe_cache("result", cached is not None)
+        if cached is None:
+            return None
+        self.metadata.update(cached["metadata"], result_cache="hit")
+        return cached["result"]
 
-    async def extract_code(self) -> str:
+    async def _extract_and_store(
+        self, cache_key: str, query_engine=None, relevant_parts=None
+    ) -> dict:
+        self.metadata["result_cache"] = "miss"
+        match = await run_blocking(self.match_fast_path)
+        if match is not None:
+            self.metadata.update(path="fast", fast_path=match.describe())
+            result = match.code
+        else:
+            self.metadata["path"] = "llm"
+            result = await self._extract_code(query_engine, relevant_parts)
+        SERVED_BY.inc(self.metadata["path"], self.request.extractor_type)
+        outcome = {"result": result, "metadata": dict(self.metadata)}
+        # Empty results are not cached, so a failed extraction is retried.
+        if result:
+            await call_result_cache(RESULT_CACHE.put, cache_key, outcome)
+        return outcome
+
+    async def _extract_code(self, query_engine=None, relevant_parts=None) -> str:
         try:
-            model_name = self.request.embedding_model
-            query = self.request.query
-            query_engine = get_query_engine(
-                self.html_content,
-                top_k=self.request.top_k,
-                streaming=self.request.streaming,
-                prompt_template=self.request.prompt_template,
-                use_local_embeddings=self.request.use_local_embeddings,
-                model_name=model_name,
-                llm_type=self.request.llm_type,
-                llm_model=self.request.llm_model,
-                query=query,
-            )
-            result = query_html(
+            if query_engine is None:
+                query_engine = await run_blocking(self.create_query_engine, False)
+            result = await aquery_html(
                 query_engine,
-                query,
+                self.request.query,
                 debug=self.request.debug,
                 request_settings=self.request.dict(),
+                relevant_parts=relevant_parts,
+                metadata=self.metadata,
             )
             return await self.process_result(result)
         except Exception as e:
             logger.error(f"Error in extract_code: {e}", exc_info=True)
             raise
 
+    async def stream_code(self):
+        """Yields (event, data) pairs: tokens, completed code lines, then result and metadata."""
+        try:
+            await self.load_html()
+            match = await run_blocking(self.match_fast_path)
+            if match is not None:
+                self.metadata.update(path="fast", fast_path=match.describe())
+                for line in match.code.splitlines():
+                    yield "code", line
+                yield "result", match.code
+                yield "metadata", self.metadata
+                return
+            self.metadata["path"] = "llm"
+            query_engine = await run_blocking(self.create_query_engine, True)
+            code_stream = CodeBlockStream(self.language)
+            async for token in astream_query_html(
+                query_engine,
+                self.request.query,
+                debug=self.request.debug,
+                request_settings=self.request.dict(),
+                metadata=self.metadata,
+            ):
+                yield "token", token
+                for line in code_stream.feed(token):
+                    yield "code", line
+            result = clean_html(code_stream.text)
+            yield "result", await self.process_result(result)
+            yield "metadata", self.metadata
+        except Exception as e:
+            logger.error(f"Error in stream_code: {e}", exc_info=True)
+            raise
+
+    def match_fast_path(self):
+        """Returns the rule-based FastPathMatch for simple locator queries, or None.
+
+        The DOM is scanned at most once per extractor; callers run this in the
+        shared executor.
+        """
+        if self._fast_path is None:
+            match = None
+            if self.request.fast_path:
+                with span("fast_path"):
+                    match = match_query(
+                        self.html_content,
+                        self.request.query,
+                        self.request.prompt_template,
+                    )
+            self._fast_path = match or False
+        return self._fast_path or None
+
+    @property
+    def language(self) -> str:
+        return "python" if self.request.prompt_template == "selenium" else "javascript"
+
+    def create_query_engine(self, streaming: bool):
+        """Builds the query engine for this request.
+
+        Chunking, indexing and embedding are CPU-bound, so callers run this in
+        the shared executor instead of on the event loop.
+        """
+        return get_query_engine(
+            self.html_content,
+            top_k=self.request.top_k,
+            streaming=streaming,
+            prompt_template=self.request.prompt_template,
+            use_local_embeddings=self.request.use_local_embeddings,
+            model_name=self.request.embedding_model,
+            llm_type=self.request.llm_type,
+            llm_model=self.request.llm_model,
+            query=self.request.query,
+            prune_html=self.request.prune_html,
+            retriever_mode=self.request.retriever_mode,
+            chunking=self.request.chunking,
+            index_entry=self.index_entry,
+        )
+
     @abstractmethod
     async def process_result(self, result: str) -> str:
         pass
 
-    def _get_html_content(self) -> str:
+    async def load_html(self):
+        """Reads the page from file_path in the executor unless it was sent inline."""
+        if self.html_content is not None:
+            return
         try:
-            if self.request.html_content:
-                return self.request.html_content
-            with open(self.request.file_path, "r", encoding="utf-8") as file:
-                return file.read()
+            with span("html_load"):
+                self.html_content = await run_blocking(
+                    _read_file, self.request.file_path
+                )
         except Exception as e:
             logger.error(f"Error reading HTML content: {e}", exc_info=True)
             raise
@@ -70,7 +227,8 @@ class AIExtractor(BaseExtractor):
     async def process_result(self, result: str) -> str:
         try:
             ai_extractor_client = AIExtractorClient()
-            return await ai_extractor_client.extract_code(result)
+            with span("ai_postprocess"):
+                return await ai_extractor_client.extract_code(result)
         except Exception as e:
             logger.error(f"Error in AIExtractor process_result: {e}", exc_info=True)
             raise
@@ -79,10 +237,92 @@ class AIExtractor(BaseExtractor):
 class NonAIExtractor(BaseExtractor):
     async def process_result(self, result: str) -> str:
         try:
-            language = (
-                "python" if self.request.prompt_template == "selenium" else "javascript"
-            )
-            return extract_first_code_block(result, language)
+            with span("code_extraction"):
+                return extract_first_code_block(result, self.language)
         except Exception as e:
             logger.error(f"Error in NonAIExtractor process_result: {e}", exc_info=True)
             raise
+
+
+async def extract_batch(request: BatchQueryRequest) -> list:
+    """Runs every query of a batch against one shared index of the page.
+
+    Retrieval for all queries happens in a single executor call; LLM calls then
+    run concurrently up to request.concurrency. Results keep the query order,
+    with failures reported per query.
+    """
+    if request.html_content:
+        html_content = request.html_content
+    else:
+        with span("html_load"):
+            html_content = await run_blocking(_read_file, request.file_path)
+    extractors = [
+        CodeExtractorFactory.get_extractor(item)
+        for item in request.to_query_requests(html_content)
+    ]
+    # Cached queries skip indexing, retrieval and the LLM altogether.
+    cached = [await extractor.lookup_result() for extractor in extractors]
+
+    def prepare():
+        # The first engine chunks and indexes the page; the rest hit the index
+        # cache. Queries answered by the cache or the fast path need neither.
+        query_engines = [None] * len(extractors)
+        relevant_parts = [None] * len(extractors)
+        pending = []
+        for position, extractor in enumerate(extractors):
+            if cached[position] is not None or extractor.match_fast_path() is not None:
+                continue
+            query_engines[position] = extractor.create_query_engine(False)
+            pending.append(position)
+        if not pending:
+            return query_engines, relevant_parts
+        # Retrieval settings are shared by the batch, so one retriever scores
+        # every remaining query at once.
+        retriever = query_engines[pending[0]].retriever
+        with span("retrieval"):
+            if hasattr(retriever, "retrieve_many"):
+                retrieved = retriever.retrieve_many(
+                    [extractors[position].request.query for position in pending]
+                )
+            else:
+                retrieved = [
+                    retriever.retrieve(QueryBundle(extractors[position].request.query))
+                    for position in pending
+                ]
+        for position, nodes in zip(pending, retrieved):
+            relevant_parts[position] = nodes
+        return query_engines, relevant_parts
+
+    query_engines, relevant_parts = await run_blocking(prepare)
+    semaphore = asyncio.Semaphore(max(1, request.concurrency))
+
+    async def run(extractor, query_engine, nodes, result):
+        if result is not None:
+            return result
+        async with semaphore:
+            return await extractor.extract_code(query_engine, nodes)
+
+    results = await asyncio.gather(
+        *[
+            run(extractor, query_engine, nodes, result)
+            for extractor, query_engine, nodes, result in zip(
+                extractors, query_engines, relevant_parts, cached
+            )
+        ],
+        return_exceptions=True,
+    )
+    return [
+        {"query": extractor.request.query, "error": str(result)}
+        if isinstance(result, Exception)
+        else {
+            "query": extractor.request.query,
+            "result": result,
+            "metadata": extractor.metadata,
+        }
+        for extractor, result in zip(extractors, results)
+    ]
+
+
+def _read_file(file_path: str) -> str:
+    with open(file_path, "r", encoding="utf-8") as file:
+        return file.read()
@@ -0,0 +1,210 @@
+import os
+import time
+import zlib
+import asyncio
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from wcg.utils.cache import LRUCache
+from wcg.utils.executor import run_blocking
+from wcg.utils.index import get_or_create_index_entry, index_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Idle pages expire after PAGE_TTL seconds; every query restarts the clock.
+PAGE_TTL = float(os.environ.get("WCG_PAGE_TTL", 1800))
+PAGE_STORE_MAX_PAGES = int(os.environ.get("WCG_PAGE_STORE_MAX_PAGES", 256))
+PAGE_STORE_MAX_BYTES = int(
+    os.environ.get("WCG_PAGE_STORE_MAX_BYTES", 512 * 1024 * 1024)
+)
+# Largest accepted page after decompression.
+PAGE_MAX_BYTES = int(os.environ.get("WCG_PAGE_MAX_BYTES", 20 * 1024 * 1024))
+
+
+class PageTooLarge(ValueError):
+    pass
+
+
+async def read_page_body(request) -> bytes:
+    """Reads a request body, rejecting it once it exceeds PAGE_MAX_BYTES.
+
+    Oversized bodies are refused by their Content-Length when it is sent, and
+    otherwise as soon as the streamed read passes the limit.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > PAGE_MAX_BYTES:
+        raise PageTooLarge(f"Page exceeds {PAGE_MAX_BYTES} bytes")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > PAGE_MAX_BYTES:
+            raise PageTooLarge(f"Page exceeds {PAGE_MAX_BYTES} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def decode_page_body(body: bytes, content_encoding: str = None) -> str:
+    """Decompresses a raw, gzip or zstd request body into HTML text.
+
+    Decompression stops at PAGE_MAX_BYTES so compressed bombs are rejected early.
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+            body, PAGE_MAX_BYTES + 1
+        )
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd bodies need the zstandard package")
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(PAGE_MAX_BYTES + 1)
+    else:
+        raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+    if len(data) > PAGE_MAX_BYTES:
+        raise PageTooLarge(f"Page exceeds {PAGE_MAX_BYTES} bytes")
+    return data.decode("utf-8", errors="replace")
+
+
+class Page:
+    """An uploaded page and the index built for it in the background."""
+
+    def __init__(
+        self,
+        page_id: str,
+        html_content: str,
+        prune_html: bool,
+        chunking: str,
+        base: "Page" = None,
+    ):
+        self.page_id = page_id
+        self.html_content = html_content
+        self.prune_html = prune_html
+        self.chunking = chunking
+        # Previous version of the page whose index is reused where unchanged;
+        # dropped once this page is indexed.
+        self.base = base
+        self.base_page_id = base.page_id if base else None
+        self.created_at = time.time()
+        self.entry = None
+        self.error = None
+        self.task = None
+
+    @property
+    def status(self) -> str:
+        if self.entry is not None:
+            return "ready"
+        return "failed" if self.error is not None else "indexing"
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.html_content) + (self.entry.nbytes if self.entry else 0)
+
+    def describe(self) -> dict:
+        return {
+            "page_id": self.page_id,
+            "status": self.status,
+            "bytes": len(self.html_content),
+            "chunks": len(self.entry.nodes) if self.entry else None,
+            "prune_html": self.prune_html,
+            "chunking": self.chunking,
+            "created_at": self.created_at,
+            "base_page_id": self.base_page_id,
+            "reuse": self.entry.reuse if self.entry else None,
+            "error": self.error,
+        }
+
+
+class PageStore:
+    """Resident uploaded pages, bounded by count, memory budget and idle TTL."""
+
+    def __init__(
+        self,
+        max_pages: int = PAGE_STORE_MAX_PAGES,
+        max_bytes: int = PAGE_STORE_MAX_BYTES,
+        ttl: float = PAGE_TTL,
+    ):
+        self._pages = LRUCache(
+            max_entries=max_pages,
+            max_bytes=max_bytes,
+            sizeof=lambda page: page.nbytes,
+            ttl=ttl,
+        )
+
+    async def add(
+        self,
+        html_content: str,
+        prune_html: bool = True,
+        chunking: str = "lines",
+        base: Page = None,
+    ):
+        """Stores a page and starts indexing it; identical uploads share one page.
+
+        With a base page (an earlier version of the same page), the new page is
+        indexed with the base's settings and only changed chunks are rebuilt.
+        """
+        if base is not None:
+            prune_html, chunking = base.prune_html, base.chunking
+        # Hashing a page of up to PAGE_MAX_BYTES is kept off the event loop.
+        page_id = (
+            await run_blocking(index_cache_key, html_content, prune_html, chunking)
+        )[:32]
+        page = self._pages.get(page_id)
+        if page is not None and page.error is None:
+            self._pages.put(page_id, page)
+            return page
+        page = Page(page_id, html_content, prune_html, chunking, base)
+        page.task = asyncio.ensure_future(self._build(page))
+        self._pages.put(page_id, page)
+        return page
+
+    async def _build(self, page: Page):
+        previous = None
+        if page.base is not None:
+            await asyncio.shield(page.base.task)
+            previous = page.base.entry
+            page.base = None
+        try:
+            page.entry = await run_blocking(
+                get_or_create_index_entry,
+                page.html_content,
+                page.prune_html,
+                page.chunking,
+                previous,
+            )
+        except Exception as e:
+            logger.error(f"Error indexing page {page.page_id}: {e}", exc_info=True)
+            page.error = str(e)
+            return
+        # Re-store the page so the memory budget accounts for its index.
+        if page.page_id in self._pages:
+            self._pages.put(page.page_id, page)
+
+    def get(self, page_id: str) -> Page:
+        return self._pages.get(page_id)
+
+    async def get_ready(self, page_id: str) -> Page:
+        """Returns the page once its index is built (or failed), or None if unknown."""
+        page = self._pages.get(page_id)
+        if page is None:
+            return None
+        await asyncio.shield(page.task)
+        if page.page_id in self._pages:
+            # Restart the idle TTL.
+            self._pages.put(page.page_id, page)
+        return page
+
+    def remove(self, page_id: str) -> Page:
+        return self._pages.pop(page_id)
+
+    def stats(self) -> dict:
+        return self._pages.stats()
+
+
+PAGES = PageStore()
@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+
+from wcg.ai.ai_core import AIExtractorClient
+from wcg.ai.providers import get_http_client
+from wcg.utils.chunking import warm_up_chunking
+from wcg.utils.executor import run_blocking
+from wcg.utils.few_shot import get_few_shot_matrix
+from wcg.utils.index import (
+    api_key_finder,
+    get_or_create_embedding_model,
+    get_or_create_llm,
+    prepare_prompt_template,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set WCG_WARMUP=0 to skip preloading and report ready immediately.
+WARMUP_ENABLED = os.environ.get("WCG_WARMUP", "1") != "0"
+# Comma-separated embedding model names to load, with their few-shot matrices.
+WARMUP_EMBEDDING_MODELS = [
+    name.strip()
+    for name in os.environ.get(
+        "WCG_WARMUP_EMBEDDING_MODELS", "BAAI/bge-small-en-v1.5"
+    ).split(",")
+    if name.strip()
+]
+# Comma-separated "llm_type:model" pairs whose clients are created up front.
+WARMUP_LLMS = [
+    pair.strip()
+    for pair in os.environ.get("WCG_WARMUP_LLMS", "openai:gpt-3.5-turbo").split(",")
+    if pair.strip()
+]
+PROMPT_TEMPLATES = ("js", "selenium")
+
+WARMUP_HTML = (
+    "<html><body><nav><a id='home' href='/'>Home</a></nav><main>"
+    "<input id='searchBox' type='search' placeholder='Search'>"
+    "<button class='btn-primary'>Submit</button><p>Warm up</p>"
+    "</main></body></html>"
+)
+
+
+class WarmupState:
+    """Progress of the startup warm-up, reported by /readyz."""
+
+    def __init__(self):
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def failed_steps(self) -> list:
+        return [name for name, step in self.steps.items() if step["error"]]
+
+    @property
+    def healthy(self) -> bool:
+        """False if a step that every request depends on failed."""
+        return not any(
+            step["error"] and step["required"] for step in self.steps.values()
+        )
+
+    @property
+    def status(self) -> str:
+        if not self.ready:
+            return "warming"
+        if not self.healthy:
+            return "failed"
+        return "degraded" if self.failed_steps else "ready"
+
+    def describe(self) -> dict:
+        return {
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": self.steps,
+        }
+
+
+WARMUP = WarmupState()
+
+
+def _warm_embedding_model(model_name: str):
+    embed_model = get_or_create_embedding_model(model_name)
+    # The first call initializes the model's runtime, not just its weights.
+    embed_model.get_query_embedding("warm up")
+    for prompt_template in PROMPT_TEMPLATES:
+        few_shot_examples, _, _ = prepare_prompt_template(prompt_template)
+        get_few_shot_matrix(embed_model, model_name, prompt_template, few_shot_examples)
+
+
+def _warm_llm(pair: str):
+    llm_type, _, model = pair.partition(":")
+    get_or_create_llm(api_key=api_key_finder(llm_type), model=model, llm_type=llm_type)
+
+
+def _warm_extractor_client():
+    AIExtractorClient().client
+
+
+async def _run_step(
+    state: WarmupState, name: str, func, *args, required: bool = False
+):
+    start = time.perf_counter()
+    error = None
+    try:
+        await run_blocking(func, *args)
+    except Exception as e:
+        # An optional step is loaded lazily by the first request instead; a
+        # required one would fail every request, so the server is not ready.
+        logger.warning(f"Warm-up step {name} failed: {e}")
+        error = str(e)
+    state.steps[name] = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "error": error,
+        "required": required,
+    }
+
+
+async def warm_up(state: WarmupState = WARMUP):
+    """Preloads the chunking grammar, embedding models, few-shot matrices and LLM clients."""
+    state.started_at = time.time()
+    if WARMUP_ENABLED:
+        get_http_client()
+        await _run_step(
+            state, "chunking", warm_up_chunking, WARMUP_HTML, required=True
+        )
+        for model_name in WARMUP_EMBEDDING_MODELS:
+            await _run_step(
+                state,
+                f"embedding:{model_name}",
+                _warm_embedding_model,
+                model_name,
+                required=True,
+            )
+        for pair in WARMUP_LLMS:
+            await _run_step(state, f"llm:{pair}", _warm_llm, pair)
+        if os.environ.get("OPENAI_API_KEY"):
+            await _run_step(state, "extractor_client", _warm_extractor_client)
+        logger.info(
+            f"Warm-up finished in {time.time() - state.started_at:.1f}s "
+            f"({len(state.steps)} steps, {len(state.failed_steps)} failed)"
+        )
+    state.finished_at = time.time()
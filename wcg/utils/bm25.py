@@ -0,0 +1,140 @@
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from wcg.utils.tokenizer import TYPO_NGRAM, TypoMatcher
+
+
+class BM25Index:
+    """Okapi BM25 over a sparse term-document matrix.
+
+    Every (term, chunk) weight, i.e. the term's idf times its length-normalized
+    frequency in the chunk, is computed once at build time and stored as a CSR
+    matrix with one row per term, which doubles as an inverted index. Scoring a
+    query is then a single sparse vector-matrix product that only touches the
+    postings of the query's terms. Scores match rank_bm25's BM25Okapi; query
+    terms missing from the corpus are first replaced by their closest known
+    term when typo matching is enabled.
+    """
+
+    def __init__(
+        self, corpus: list, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25
+    ):
+        self.vocabulary = {}
+        self._typo_matcher = None
+        indptr = [0]
+        indices = []
+        counts = []
+        for tokens in corpus:
+            for term, count in Counter(tokens).items():
+                indices.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+        # Chunk-major term counts, kept to recover each chunk's terms.
+        self.term_counts = csr_matrix(
+            (
+                np.asarray(counts, dtype=np.float32),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int32),
+            ),
+            shape=(len(corpus), len(self.vocabulary)),
+        )
+
+        chunk_lengths = np.asarray(self.term_counts.sum(axis=1), dtype=np.float32).ravel()
+        average_length = chunk_lengths.mean() if len(corpus) else 0.0
+        document_frequency = np.bincount(
+            self.term_counts.indices, minlength=len(self.vocabulary)
+        )
+        self.idf = (
+            np.log(len(corpus) - document_frequency + 0.5)
+            - np.log(document_frequency + 0.5)
+        ).astype(np.float32)
+        if len(self.idf):
+            # Terms in more than half of the chunks get a small positive idf.
+            self.idf[self.idf < 0] = epsilon * self.idf.mean()
+
+        frequencies = self.term_counts.data
+        length_norms = k1 * (
+            1 - b + b * chunk_lengths / max(float(average_length), 1e-9)
+        )
+        rows = np.repeat(np.arange(len(corpus)), np.diff(self.term_counts.indptr))
+        weights = (
+            self.idf[self.term_counts.indices]
+            * frequencies
+            * (k1 + 1)
+            / (frequencies + length_norms[rows])
+        )
+        self.weights = csr_matrix(
+            (weights, self.term_counts.indices, self.term_counts.indptr),
+            shape=self.term_counts.shape,
+        ).T.tocsr()
+
+    def __len__(self) -> int:
+        return self.term_counts.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in (self.term_counts, self.weights)
+        ) + self.idf.nbytes
+
+    def correct_terms(self, terms: list) -> list:
+        """Replaces misspelled terms with the closest term of the corpus, if any."""
+        if not TYPO_NGRAM or all(term in self.vocabulary for term in terms):
+            return terms
+        if self._typo_matcher is None:
+            self._typo_matcher = TypoMatcher(self.vocabulary)
+        corrected = []
+        for term in terms:
+            if term not in self.vocabulary:
+                term = self._typo_matcher.match(term) or term
+            corrected.append(term)
+        return corrected
+
+    def query_matrix(self, queries: list) -> csr_matrix:
+        """Builds a (queries x terms) matrix of query term counts; unknown terms are dropped."""
+        indptr = [0]
+        indices = []
+        counts = []
+        for tokens in queries:
+            for term, count in Counter(tokens).items():
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    indices.append(column)
+                    counts.append(count)
+            indptr.append(len(indices))
+        return csr_matrix(
+            (
+                np.asarray(counts, dtype=np.float32),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int32),
+            ),
+            shape=(len(queries), len(self.vocabulary)),
+        )
+
+    def get_scores(self, query: list) -> np.ndarray:
+        """Returns the BM25 score of every chunk for one tokenized query."""
+        return self.get_batch_scores([query])[0]
+
+    def get_batch_scores(self, queries: list) -> np.ndarray:
+        """Returns a (queries x chunks) array of BM25 scores in one sparse product."""
+        queries = [self.correct_terms(terms) for terms in queries]
+        return (self.query_matrix(queries) @ self.weights).toarray()
+
+    def documents(self) -> list:
+        """Returns the terms of every chunk, each repeated by its count."""
+        terms = list(self.vocabulary)
+        indptr = self.term_counts.indptr
+        return [
+            [
+                terms[column]
+                for column, count in zip(
+                    self.term_counts.indices[start:end],
+                    self.term_counts.data[start:end],
+                )
+                for _ in range(int(count))
+            ]
+            for start, end in zip(indptr[:-1], indptr[1:])
+        ]
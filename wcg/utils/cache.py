@@ -0,0 +1,247 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def content_hash(*parts) -> str:
+    """Returns a stable SHA-256 hex digest over the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache bounded by entry count and total size.
+
+    Entries optionally expire ttl seconds after they were stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 16,
+        max_bytes: int = None,
+        sizeof=None,
+        ttl: float = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._total_bytes = 0
+        # No entry expires before this time; an expiry sweep is skipped until then.
+        self._next_expiry = float("inf")
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, marking it as most recently used."""
+        with self._lock:
+            if key in self._data and self._expires[key] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores value under key, evicting least recently used entries if needed."""
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._expires[key] = (
+                time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+            )
+            self._next_expiry = min(self._next_expiry, self._expires[key])
+            self._total_bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        """Removes key from the cache and returns its value."""
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self._total_bytes = 0
+            self._next_expiry = float("inf")
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        del self._data[key]
+        del self._expires[key]
+        self._total_bytes -= self._sizes.pop(key)
+
+    def _expire(self):
+        now = time.monotonic()
+        if now < self._next_expiry:
+            return
+        expired = [key for key, expires in self._expires.items() if expires < now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        self._next_expiry = min(self._expires.values(), default=float("inf"))
+
+    def _evict(self):
+        # Expired entries go first, so they never push out live ones.
+        self._expire()
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data and self._expires[key] >= time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """A persistent key/value cache for JSON-serializable values with TTL and LRU eviction.
+
+    Every call blocks on disk I/O, so async callers should run it in the
+    executor. Lookups only read; the access times they update are written
+    with the next put.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+        )
+        self._connection.commit()
+        # {key: access time} of hits not yet written to the accessed_at column.
+        self._accessed = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            # Expired rows are deleted by the next put.
+            if row is None or row[1] < now:
+                self.misses += 1
+                return default
+            self._accessed[key] = now
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._write_accessed()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            # Expired rows go first, so they never push out live ones.
+            self.expirations += self._connection.execute(
+                "DELETE FROM cache WHERE expires_at < ?", (now,)
+            ).rowcount
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._connection.commit()
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._connection.commit()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self._connection.execute("DELETE FROM cache")
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count(),
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _write_accessed(self):
+        if self._accessed:
+            self._connection.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from llama_index.core.node_parser import CodeSplitter
+
+from wcg.utils.prune import prune_html
+from wcg.utils.dom import extract_elements
+from wcg.utils.tokenizer import tokenize_html
+
+MAX_CHUNK_CHARS = 2000
+CHUNKING_STRATEGIES = ("lines", "dom")
+
+# Number of worker processes for chunking; 0 keeps the stage in-process.
+INDEX_PROCESSES = int(os.environ.get("WCG_INDEX_PROCESSES", 0))
+
+_pool = None
+_pool_lock = threading.Lock()
+_queue_depth = 0
+_submitted = 0
+
+
+def calculate_chunk_parameters(html_content: str) -> (int, int):
+    """Calculate chunk lines and overlap based on HTML content."""
+    average_paragraph_length = sum(len(p) for p in html_content.split("</p>")) / max(
+        1, html_content.count("</p>")
+    )
+    chunk_lines = max(40, int(average_paragraph_length / 40))
+    chunk_lines_overlap = int(chunk_lines * 0.25)
+    return chunk_lines, chunk_lines_overlap
+
+
+def split_html_text(
+    html_content: str, chunk_lines: int, chunk_lines_overlap: int
+) -> list:
+    """Splits HTML content into non-empty text chunks."""
+    splitter = CodeSplitter(
+        language="html",
+        chunk_lines=chunk_lines,
+        chunk_lines_overlap=chunk_lines_overlap,
+        max_chars=MAX_CHUNK_CHARS,
+    )
+    return [chunk for chunk in splitter.split_text(html_content) if chunk.strip()]
+
+
+def build_chunk_payload(
+    html_content: str,
+    prune: bool = True,
+    chunking: str = "lines",
+    known_terms: dict = None,
+) -> dict:
+    """Chunks a page and tokenizes its BM25 corpus.
+
+    With chunking="lines" the page is pruned and split by CodeSplitter; with
+    chunking="dom" every interactive or labelled element becomes its own chunk.
+    Runs in a worker process when the pool is enabled, so the payload only holds
+    plain strings, token lists and stats. Stage timings are returned in the
+    payload for the caller to record.
+
+    known_terms maps chunk texts of a previous version of the page to their
+    tokens; those chunks are not tokenized again.
+    """
+    prune_stats = None
+    timings = {}
+    start = time.perf_counter()
+    if chunking == "dom":
+        chunks = [element.to_html() for element in extract_elements(html_content)]
+    elif chunking == "lines":
+        if prune:
+            html_content, prune_stats = prune_html(html_content)
+            timings["prune"] = time.perf_counter() - start
+            start = time.perf_counter()
+        chunk_lines, chunk_lines_overlap = calculate_chunk_parameters(html_content)
+        chunks = split_html_text(html_content, chunk_lines, chunk_lines_overlap)
+    else:
+        raise ValueError(f"Unknown chunking strategy: {chunking}")
+    timings["split"] = time.perf_counter() - start
+    start = time.perf_counter()
+    known_terms = known_terms or {}
+    corpus = [
+        known_terms[chunk] if chunk in known_terms else tokenize_html(chunk)
+        for chunk in chunks
+    ]
+    timings["tokenize"] = time.perf_counter() - start
+    return {
+        "chunks": chunks,
+        "corpus": corpus,
+        "prune_stats": prune_stats,
+        "timings": timings,
+    }
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Returns the shared chunking process pool, or None when it is disabled."""
+    global _pool
+    if INDEX_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INDEX_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _task_done(_future):
+    global _queue_depth
+    with _pool_lock:
+        _queue_depth -= 1
+
+
+def prepare_chunks(
+    html_content: str,
+    prune: bool = True,
+    chunking: str = "lines",
+    known_terms: dict = None,
+) -> dict:
+    """Builds the chunk payload, in the process pool if one is configured."""
+    global _queue_depth, _submitted
+    pool = get_pool()
+    if pool is None:
+        return build_chunk_payload(html_content, prune, chunking, known_terms)
+    with _pool_lock:
+        _queue_depth += 1
+        _submitted += 1
+    future = pool.submit(
+        build_chunk_payload, html_content, prune, chunking, known_terms
+    )
+    future.add_done_callback(_task_done)
+    return future.result()
+
+
+def warm_up_chunking(html_content: str):
+    """Chunks a small page with every strategy to load the HTML grammar and tokenizer.
+
+    With the process pool enabled, enough jobs are queued to start every worker.
+    """
+    for chunking in CHUNKING_STRATEGIES:
+        build_chunk_payload(html_content, True, chunking)
+    pool = get_pool()
+    if pool is not None:
+        futures = [
+            pool.submit(build_chunk_payload, html_content, True, chunking)
+            for _ in range(INDEX_PROCESSES)
+            for chunking in CHUNKING_STRATEGIES
+        ]
+        for future in futures:
+            future.result()
+
+
+def pool_stats() -> dict:
+    """Returns the pool size and the number of chunking jobs queued or running."""
+    with _pool_lock:
+        return {
+            "processes": max(INDEX_PROCESSES, 0),
+            "queue_depth": _queue_depth,
+            "submitted": _submitted,
+        }
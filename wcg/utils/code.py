@@ -20,3 +20,53 @@ def extract_first_code_block(markdown_text: str, language: str) -> str:
     pattern = re.compile(rf"```{language}(.*?)```", re.DOTALL)
     match = pattern.search(markdown_text)
     return clean_code(match.group(1).strip()) if match else None
+
+
+class CodeBlockStream:
+    """Incrementally extracts the first code block of a language from streamed markdown.
+
+    Tokens are fed as they arrive; complete lines inside the block are returned
+    as soon as their newline is seen, cleaned the same way clean_code cleans
+    single lines. Multi-line strings are only removed by extract_first_code_block
+    on the final text.
+    """
+
+    def __init__(self, language: str):
+        self.fence = f"```{language}"
+        self.text = ""
+        self._position = 0
+        self._state = "before"
+
+    def feed(self, token: str) -> list:
+        """Adds a token and returns the cleaned code lines completed by it."""
+        self.text += token
+        lines = []
+        if self._state == "before":
+            start = self.text.find(self.fence, self._position)
+            if start == -1:
+                self._position = max(0, len(self.text) - len(self.fence))
+                return lines
+            self._position = start + len(self.fence)
+            self._state = "inside"
+        while self._state == "inside":
+            newline = self.text.find("\n", self._position)
+            closing = self.text.find("```", self._position)
+            if closing != -1 and (newline == -1 or closing < newline):
+                lines.extend(self._clean_line(self.text[self._position : closing]))
+                self._position = closing + 3
+                self._state = "done"
+            elif newline != -1:
+                lines.extend(self._clean_line(self.text[self._position : newline]))
+                self._position = newline + 1
+            else:
+                break
+        return lines
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    @staticmethod
+    def _clean_line(line: str) -> list:
+        line = single_line_comment_re.sub("", line).strip()
+        return [line] if line else []
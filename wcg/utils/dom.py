@@ -0,0 +1,188 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from wcg.utils.prune import DROPPED_TAGS, VOID_TAGS
+
+INTERACTIVE_TAGS = {
+    "a",
+    "button",
+    "input",
+    "select",
+    "option",
+    "textarea",
+    "label",
+    "summary",
+}
+LABELLED_TAGS = {"h1", "h2", "h3", "h4", "img"}
+INTERACTIVE_ROLES = {
+    "button",
+    "link",
+    "tab",
+    "menuitem",
+    "checkbox",
+    "radio",
+    "combobox",
+    "textbox",
+    "searchbox",
+    "option",
+    "switch",
+    "treeitem",
+}
+MAX_TEXT_CHARS = 200
+MAX_ATTRIBUTE_CHARS = 200
+PATH_DEPTH = 3
+
+whitespace_re = re.compile(r"\s+")
+
+
+class ElementRecord:
+    """Compact description of one interactive or labelled element."""
+
+    __slots__ = (
+        "tag",
+        "id",
+        "classes",
+        "name",
+        "type",
+        "role",
+        "aria_label",
+        "placeholder",
+        "title",
+        "alt",
+        "value",
+        "href",
+        "text",
+        "path",
+    )
+
+    # Attributes rendered by to_html, in this order.
+    ATTRIBUTES = (
+        ("id", "id"),
+        ("class", "classes"),
+        ("name", "name"),
+        ("type", "type"),
+        ("role", "role"),
+        ("aria-label", "aria_label"),
+        ("placeholder", "placeholder"),
+        ("title", "title"),
+        ("alt", "alt"),
+        ("value", "value"),
+        ("href", "href"),
+    )
+
+    def __init__(self, tag: str, attrs: dict, path: str):
+        self.tag = tag
+        for attribute, slot in self.ATTRIBUTES:
+            value = attrs.get(attribute)
+            if value and (
+                len(value) > MAX_ATTRIBUTE_CHARS or value.startswith("data:")
+            ):
+                value = None
+            setattr(self, slot, value or None)
+        self.text = ""
+        self.path = path
+
+    def add_text(self, text: str):
+        if len(self.text) < MAX_TEXT_CHARS:
+            self.text = (self.text + text)[:MAX_TEXT_CHARS]
+
+    def to_html(self) -> str:
+        """Renders the record as a one-element HTML snippet preceded by its ancestor path."""
+        attributes = "".join(
+            f' {attribute}="{escape(getattr(self, slot), quote=True)}"'
+            for attribute, slot in self.ATTRIBUTES
+            if getattr(self, slot)
+        )
+        element = f"<{self.tag}{attributes}>"
+        if self.tag not in VOID_TAGS:
+            element += f"{escape(self.text.strip(), quote=False)}</{self.tag}>"
+        return f"<!-- {self.path} -->\n{element}" if self.path else element
+
+
+def _is_candidate(tag: str, attrs: dict) -> bool:
+    if tag == "input" and attrs.get("type") == "hidden":
+        return False
+    return (
+        tag in INTERACTIVE_TAGS
+        or tag in LABELLED_TAGS
+        or attrs.get("role") in INTERACTIVE_ROLES
+        or "onclick" in attrs
+        or "contenteditable" in attrs
+        or bool(attrs.get("aria-label") or attrs.get("placeholder"))
+    )
+
+
+def _describe(tag: str, attrs: dict) -> str:
+    if attrs.get("id"):
+        return f"{tag}#{attrs['id']}"
+    classes = (attrs.get("class") or "").split()
+    return f"{tag}.{classes[0]}" if classes else tag
+
+
+class ElementExtractor(HTMLParser):
+    """Walks the DOM once and collects an ElementRecord per candidate element."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        # Open elements as (tag, description, record or None).
+        self._stack = []
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in DROPPED_TAGS:
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        attrs = {name: value for name, value in attrs if value is not None}
+        record = None
+        if _is_candidate(tag, attrs):
+            path = " > ".join(entry[1] for entry in self._stack[-PATH_DEPTH:])
+            record = ElementRecord(tag, attrs, path)
+            self.records.append(record)
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, _describe(tag, attrs), record))
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skip_tag is not None or tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self._stack and self._stack[-1][0] == tag:
+            self._stack.pop()
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        # Close implicitly closed children along with the matching element.
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                del self._stack[position:]
+                break
+
+    def handle_data(self, data):
+        if self._skip_tag is not None:
+            return
+        text = whitespace_re.sub(" ", data)
+        if not text.strip():
+            return
+        for _, _, record in self._stack:
+            if record is not None:
+                record.add_text(text)
+
+
+def extract_elements(html_content: str) -> list:
+    """Returns the ElementRecords of a page in document order."""
+    extractor = ElementExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return extractor.records
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EXECUTOR_WORKERS = int(
+    os.environ.get("WCG_EXECUTOR_WORKERS", min(32, (os.cpu_count() or 1) + 4))
+)
+
+# Streams hold a thread for as long as the LLM keeps sending tokens, so they
+# get their own pool and cannot starve indexing and retrieval.
+STREAM_WORKERS = int(os.environ.get("WCG_STREAM_WORKERS", 64))
+
+_executor = None
+_stream_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the shared, bounded executor used for blocking pipeline stages."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=EXECUTOR_WORKERS, thread_name_prefix="wcg"
+        )
+    return _executor
+
+
+def get_stream_executor() -> ThreadPoolExecutor:
+    """Returns the executor that drains blocking streams for iterate_blocking."""
+    global _stream_executor
+    if _stream_executor is None:
+        _stream_executor = ThreadPoolExecutor(
+            max_workers=STREAM_WORKERS, thread_name_prefix="wcg-stream"
+        )
+    return _stream_executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking or CPU-bound callable off the event loop.
+
+    The caller's context variables are propagated to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+async def iterate_blocking(iterable):
+    """Consumes a blocking iterator in the stream executor, yielding its items as they arrive.
+
+    If the consumer stops early, e.g. a streaming client disconnects, the
+    producer thread stops after the item it is on and closes the iterator.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    context = contextvars.copy_context()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, ("item", item))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            if stop.is_set() and hasattr(iterable, "close"):
+                iterable.close()
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+
+    producer = loop.run_in_executor(get_stream_executor(), context.run, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                break
+    finally:
+        stop.set()
+    await producer
@@ -0,0 +1,364 @@
+import os
+import re
+import json
+from collections import Counter
+
+from wcg.utils.cache import LRUCache, content_hash
+from wcg.utils.dom import MAX_TEXT_CHARS, extract_elements
+
+# Minimum score of the best element, and its lead over the runner-up, for the
+# fast path to answer without an LLM.
+FAST_PATH_THRESHOLD = float(os.environ.get("WCG_FAST_PATH_THRESHOLD", 0.75))
+FAST_PATH_MARGIN = float(os.environ.get("WCG_FAST_PATH_MARGIN", 0.15))
+
+ELEMENT_CACHE = LRUCache(
+    max_entries=int(os.environ.get("WCG_FAST_PATH_CACHE_SIZE", 16))
+)
+
+# Queries chaining several steps are left to the LLM.
+compound_re = re.compile(
+    r"\b(?:and|then)\s+(?:then\s+)?(?:click|press|tap|type|enter|go|navigate|open|select|search|scroll)\b"
+)
+type_re = re.compile(
+    r"^(?:type|enter|write|input|fill in)\s+(?:in\s+)?(?:the\s+)?"
+    r"(?:(?:search\s+)?(?:query|text|word|value)\s+)?"
+    r"[\"'](?P<value>[^\"']+)[\"']\s+(?:in|into|on)\s+(?:the\s+)?(?P<target>.+)$"
+)
+# Only searches whose value is unambiguous: quoted, or introduced by "word" or
+# the like. "search for the model X" means the value is X, not "model X", and
+# is left to the LLM.
+search_re = re.compile(
+    r"^search\s+for\s+(?:the\s+)?"
+    r"(?:(?:(?:word|term|query|text|phrase)\s+)?[\"'](?P<quoted>[^\"']+)[\"']"
+    r"|(?:word|term|query|text|phrase)\s+(?P<value>[^\"']+?))$"
+)
+click_re = re.compile(r"^(?:click|press|tap)\s+(?:on\s+)?(?:the\s+)?(?P<target>.+)$")
+goto_re = re.compile(
+    r"^(?:go|navigate|open)\s+(?:to\s+)?(?:the\s+)?(?P<target>.+)$"
+)
+word_re = re.compile(r"[a-z0-9]+")
+camel_re = re.compile(r"([a-z0-9])([A-Z])")
+plain_id_re = re.compile(r"^[A-Za-z][\w-]*$")
+
+STOP_WORDS = {
+    "a",
+    "an",
+    "the",
+    "on",
+    "in",
+    "to",
+    "of",
+    "for",
+    "with",
+    "at",
+    "by",
+    "this",
+    "that",
+    "my",
+    "its",
+    "about",
+    "see",
+}
+# Words describing the kind of element rather than its label, mapped to the
+# element kinds they ask for.
+KIND_WORDS = {
+    "box": "input",
+    "field": "input",
+    "input": "input",
+    "bar": "input",
+    "textbox": "input",
+    "button": "button",
+    "btn": "button",
+    "link": "link",
+    "page": "link",
+    "tab": "link",
+    "website": "link",
+    "site": "link",
+}
+INPUT_TYPES = {None, "text", "search", "email", "password", "url", "tel", "number"}
+# Input names conventionally used by search fields.
+SEARCH_NAMES = {"q", "query", "search", "search_query", "keyword", "keywords"}
+UNSAFE_CHARS = "'\"\\\n\r\t"
+
+
+class FastPathMatch:
+    """The element chosen for a query and the code generated for it."""
+
+    __slots__ = ("action", "value", "record", "score", "locator", "code")
+
+    def __init__(self, action, value, record, score, locator, code):
+        self.action = action
+        self.value = value
+        self.record = record
+        self.score = score
+        self.locator = locator
+        self.code = code
+
+    def describe(self) -> dict:
+        return {
+            "action": self.action,
+            "score": round(self.score, 3),
+            "locator": self.locator[1],
+        }
+
+
+def parse_query(query: str):
+    """Splits a single-step query into (action, target words, value), or None."""
+    text = " ".join(query.strip().rstrip(".").split())
+    lowered = text.lower()
+    if compound_re.search(lowered):
+        return None
+    match = type_re.match(lowered)
+    if match:
+        # Keep the typed value's original casing.
+        value = text[match.start("value") : match.end("value")]
+        return "type", match.group("target"), value
+    match = search_re.match(lowered)
+    if match:
+        group = "quoted" if match.group("quoted") is not None else "value"
+        value = text[match.start(group) : match.end(group)]
+        return "search", "search", value
+    match = click_re.match(lowered)
+    if match:
+        return "click", match.group("target"), None
+    match = goto_re.match(lowered)
+    if match:
+        return "click", match.group("target") + " link", None
+    return None
+
+
+def _normalize(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _words(text: str) -> list:
+    text = camel_re.sub(r"\1 \2", text)
+    return [_normalize(word) for word in word_re.findall(text.lower())]
+
+
+def _target_words(target: str) -> (set, set):
+    words = set()
+    kinds = set()
+    for word in _words(target):
+        if word in KIND_WORDS:
+            kinds.add(KIND_WORDS[word])
+        elif word not in STOP_WORDS:
+            words.add(word)
+    return words, kinds
+
+
+def _element_kind(record) -> str:
+    if record.tag == "textarea" or record.role in ("textbox", "searchbox", "combobox"):
+        return "input"
+    if record.tag == "input":
+        if record.type in ("submit", "button", "image", "reset"):
+            return "button"
+        return "input" if record.type in INPUT_TYPES else "other"
+    if record.tag == "button" or record.role == "button":
+        return "button"
+    if record.tag == "a" or record.role in ("link", "tab", "menuitem"):
+        return "link"
+    return "other"
+
+
+def _element_words(record) -> set:
+    words = set()
+    for value in (
+        record.text,
+        record.aria_label,
+        record.placeholder,
+        record.title,
+        record.alt,
+        record.value,
+        record.name,
+        record.id,
+        record.type,
+        record.role,
+    ):
+        if value:
+            words.update(_words(value))
+    if record.href and not record.href.startswith(("http", "//", "javascript:")):
+        words.update(_words(record.href))
+    if (
+        record.name in SEARCH_NAMES
+        or record.type == "search"
+        or record.role == "searchbox"
+    ):
+        words.add("search")
+    return words
+
+
+def score_element(record, words: set, kinds: set) -> float:
+    """Fraction of target words the element mentions, adjusted for label length and kind."""
+    kind = _element_kind(record)
+    if not words:
+        # "click on the button": only the element kind can be matched.
+        return 0.5 if kind in kinds else 0.0
+    score = len(words & _element_words(record)) / len(words)
+    # Prefer concise labels: "Models" over a card whose long text mentions models.
+    label = _words(
+        record.text
+        or record.aria_label
+        or record.placeholder
+        or record.title
+        or record.value
+        or ""
+    )
+    if label:
+        score += 0.2 * len(words.intersection(label)) / len(set(label))
+    if kinds:
+        score += 0.1 if kind in kinds else -0.3
+    if kind == "other":
+        score -= 0.2
+    return score
+
+
+def _locator(record, counts: Counter):
+    """Returns a (css selector or None, xpath) pair identifying the record, or None."""
+    candidates = [
+        ("id", record.id),
+        ("name", record.name),
+        ("aria-label", record.aria_label),
+        ("placeholder", record.placeholder),
+    ]
+    for attribute, value in candidates:
+        if not value or any(char in value for char in UNSAFE_CHARS):
+            continue
+        if counts[(attribute, value)] > 1:
+            continue
+        if attribute == "id":
+            css = f"#{value}" if plain_id_re.match(value) else f'[id="{value}"]'
+            return css, f"//*[@id='{value}']"
+        return (
+            f'{record.tag}[{attribute}="{value}"]',
+            f"//{record.tag}[@{attribute}='{value}']",
+        )
+    # Links sharing an href lead to the same place, so duplicates are fine.
+    if record.tag == "a" and record.href and not any(
+        char in record.href for char in UNSAFE_CHARS
+    ):
+        return f'a[href="{record.href}"]', f"//a[@href='{record.href}']"
+    text = record.text.strip()
+    if (
+        text
+        and len(record.text) < MAX_TEXT_CHARS
+        and counts[("text", record.tag, text)] == 1
+        and not any(char in text for char in UNSAFE_CHARS)
+    ):
+        return None, f"//{record.tag}[normalize-space()='{text}']"
+    return None
+
+
+def _count_locators(records: list) -> Counter:
+    counts = Counter()
+    for record in records:
+        for attribute, value in (
+            ("id", record.id),
+            ("name", record.name),
+            ("aria-label", record.aria_label),
+            ("placeholder", record.placeholder),
+        ):
+            if value:
+                counts[(attribute, value)] += 1
+        counts[("text", record.tag, record.text.strip())] += 1
+    return counts
+
+
+def render_code(action: str, value: str, locator: tuple, prompt_template: str) -> str:
+    """Renders the code for the action in the same shape as the few-shot completions."""
+    css, xpath = locator
+    if prompt_template == "selenium":
+        lines = [f'element = driver.find_element(By.XPATH, "{xpath}")', "element.click()"]
+        if action in ("type", "search"):
+            lines.append(f"element.send_keys({json.dumps(value)})")
+        if action == "search":
+            lines.append("element.send_keys(Keys.ENTER)")
+        return "\n".join(lines)
+
+    if css is not None:
+        select = f"document.querySelector('{css}')"
+    else:
+        select = (
+            f'document.evaluate("{xpath}", document, null, '
+            "XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue"
+        )
+    if action == "click":
+        return f"{select}.click();"
+    lines = [
+        f"const element = {select};",
+        "element.click();",
+        f"element.value = {json.dumps(value)};",
+        "element.dispatchEvent(new Event('input', {'bubbles': true}));",
+    ]
+    if action == "search":
+        lines.append(
+            "element.dispatchEvent(new KeyboardEvent('keypress', {'key': 'Enter'}));"
+        )
+    return "\n".join(lines)
+
+
+def get_elements(html_content: str) -> list:
+    """Returns the page's ElementRecords, caching them per page."""
+    key = content_hash(html_content)
+    records = ELEMENT_CACHE.get(key)
+    if records is None:
+        records = extract_elements(html_content)
+        ELEMENT_CACHE.put(key, records)
+    return records
+
+
+def match_query(
+    html_content: str,
+    query: str,
+    prompt_template: str = "js",
+    threshold: float = FAST_PATH_THRESHOLD,
+    margin: float = FAST_PATH_MARGIN,
+):
+    """Answers a simple locator query from the DOM alone.
+
+    Returns a FastPathMatch when one element clearly matches the query, or None
+    when the query should go through the LLM instead.
+    """
+    parsed = parse_query(query)
+    if parsed is None:
+        return None
+    action, target, value = parsed
+    words, kinds = _target_words(target)
+    if action in ("type", "search"):
+        kinds = {"input"}
+    if not words and not kinds:
+        return None
+
+    records = get_elements(html_content)
+    counts = _count_locators(records)
+    ranked = []
+    for record in records:
+        score = score_element(record, words, kinds)
+        if score > 0:
+            ranked.append((score, record))
+    if not ranked:
+        return None
+    ranked.sort(key=lambda item: item[0], reverse=True)
+
+    best_score, best = ranked[0]
+    if best_score < threshold:
+        return None
+    locator = _locator(best, counts)
+    if locator is None:
+        return None
+    for score, record in ranked[1:]:
+        if best_score - score >= margin:
+            break
+        # Near-ties are only acceptable when they resolve to the same element.
+        if _locator(record, counts) != locator:
+            return None
+    return FastPathMatch(
+        action,
+        value,
+        best,
+        best_score,
+        locator,
+        render_code(action, value, locator, prompt_template),
+    )
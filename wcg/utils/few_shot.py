@@ -0,0 +1,77 @@
+import os
+import re
+import threading
+import logging
+import numpy as np
+
+from wcg.utils import prompts
+from wcg.utils.cache import content_hash
+from wcg.utils.retrievers import normalize_rows
+from wcg.ai.embeddings import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+FEW_SHOT_CACHE_DIR = os.environ.get("WCG_FEW_SHOT_CACHE_DIR")
+
+# (model name, template) -> row-normalized float32 matrix of few-shot query embeddings
+FEW_SHOT_MATRIX_CACHE = {}
+_matrix_lock = threading.Lock()
+
+
+def prompt_module_hash() -> str:
+    """Hashes the prompt module source so persisted matrices expire when examples change."""
+    with open(prompts.__file__, "rb") as file:
+        return content_hash(file.read())[:16]
+
+
+def _matrix_path(model_name: str, prompt_template: str) -> str:
+    safe_model_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+    file_name = f"{safe_model_name}-{prompt_template}-{prompt_module_hash()}.npy"
+    return os.path.join(FEW_SHOT_CACHE_DIR, file_name)
+
+
+def get_few_shot_matrix(
+    embed_model, model_name: str, prompt_template: str, few_shot_examples: list
+) -> np.ndarray:
+    """Returns the few-shot query embedding matrix, embedding the examples only once."""
+    cache_key = (model_name, prompt_template)
+    matrix = FEW_SHOT_MATRIX_CACHE.get(cache_key)
+    if matrix is not None:
+        return matrix
+
+    with _matrix_lock:
+        matrix = FEW_SHOT_MATRIX_CACHE.get(cache_key)
+        if matrix is not None:
+            return matrix
+
+        path = _matrix_path(model_name, prompt_template) if FEW_SHOT_CACHE_DIR else None
+        if path and os.path.exists(path):
+            matrix = np.load(path)
+        if matrix is None or matrix.shape[0] != len(few_shot_examples):
+            logger.info(
+                f"Embedding {len(few_shot_examples)} few-shot examples for "
+                f"{model_name} ({prompt_template})"
+            )
+            matrix = normalize_rows(
+                EmbeddingService(embed_model).embed_queries(
+                    [example["query"] for example in few_shot_examples]
+                )
+            )
+            if path:
+                os.makedirs(FEW_SHOT_CACHE_DIR, exist_ok=True)
+                np.save(path, matrix)
+
+        FEW_SHOT_MATRIX_CACHE[cache_key] = matrix
+        return matrix
+
+
+def select_few_shot_indices(
+    query_embedding, few_shot_matrix: np.ndarray, top_k: int
+) -> np.ndarray:
+    """Returns indices of the top_k examples closest to the query by cosine similarity."""
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query_vector)
+    if norm:
+        query_vector = query_vector / norm
+    similarities = few_shot_matrix @ query_vector
+    return np.argsort(-similarities, kind="stable")[:top_k]
@@ -1,6 +1,12 @@
 from bs4 import BeautifulSoup
 import json
 from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import QueryBundle
+
+from wcg.ai.providers import get_limiter
+from wcg.utils.executor import run_blocking, iterate_blocking
+from wcg.utils.metrics import CHUNKS, PROMPT_TOKENS, record, span
+from wcg.utils.prompt_builder import pack_relevant_parts
 
 
 def clean_html(html_content: str) -> str:
@@ -14,15 +20,106 @@ def clean_html(html_content: str) -> str:
     return "\n".join(chunk for chunk in chunks if chunk)
 
 
-def query_html(
+async def aquery_html(
     query_engine: RetrieverQueryEngine,
     task_definition: str,
     request_settings: dict,
     debug: bool = False,
+    relevant_parts: list = None,
+    metadata: dict = None,
+) -> str:
+    """Queries the HTML content: retrieval runs in the executor and synthesis awaits the LLM.
+
+    Nodes that were already retrieved, e.g. by the batch path, can be passed in
+    as relevant_parts to skip retrieval.
+    """
+    query_bundle = QueryBundle(task_definition)
+    if relevant_parts is None:
+        with span("retrieval"):
+            relevant_parts = await run_blocking(query_engine.retrieve, query_bundle)
+    relevant_parts = pack_prompt(
+        query_engine, task_definition, relevant_parts, request_settings, metadata
+    )
+    with span("llm"):
+        response = await get_limiter(request_settings["llm_type"]).call(
+            query_engine.asynthesize, query_bundle, relevant_parts
+        )
+    return finalize_response(
+        response, relevant_parts, task_definition, request_settings, debug
+    )
+
+
+async def astream_query_html(
+    query_engine: RetrieverQueryEngine,
+    task_definition: str,
+    request_settings: dict,
+    debug: bool = False,
+    metadata: dict = None,
+):
+    """Yields response tokens as the streaming synthesizer produces them.
+
+    The query engine must be built with streaming=True. Debug information is
+    saved once the stream is exhausted.
+    """
+    query_bundle = QueryBundle(task_definition)
+    with span("retrieval"):
+        relevant_parts = await run_blocking(query_engine.retrieve, query_bundle)
+    relevant_parts = pack_prompt(
+        query_engine, task_definition, relevant_parts, request_settings, metadata
+    )
+    limiter = get_limiter(request_settings["llm_type"])
+    tokens = []
+    # The slot is held until the stream is drained; only opening it is retried.
+    with span("llm"):
+        async with limiter.slot():
+            response = await limiter.retry(
+                run_blocking, query_engine.synthesize, query_bundle, relevant_parts
+            )
+            async for token in iterate_blocking(response.response_gen):
+                tokens.append(token)
+                yield token
+    if debug:
+        finalize_response(
+            "".join(tokens), relevant_parts, task_definition, request_settings, debug
+        )
+
+
+def pack_prompt(
+    query_engine: RetrieverQueryEngine,
+    task_definition: str,
+    relevant_parts: list,
+    request_settings: dict,
+    metadata: dict = None,
+) -> list:
+    """Trims retrieved nodes to the LLM's prompt token budget and records the prompt size."""
+    prompt_template = query_engine.get_prompts()[
+        "response_synthesizer:text_qa_template"
+    ].get_template()
+    packed_parts, prompt_tokens = pack_relevant_parts(
+        prompt_template,
+        task_definition,
+        relevant_parts,
+        request_settings["llm_model"],
+    )
+    CHUNKS.observe("retrieved", len(relevant_parts))
+    CHUNKS.observe("prompt", len(packed_parts))
+    PROMPT_TOKENS.observe(request_settings["llm_model"], prompt_tokens)
+    record("prompt_tokens", prompt_tokens)
+    if metadata is not None:
+        metadata["retrieved_chunks"] = len(relevant_parts)
+        metadata["prompt_chunks"] = len(packed_parts)
+        metadata["prompt_tokens"] = prompt_tokens
+    return packed_parts
+
+
+def finalize_response(
+    response,
+    relevant_parts: list,
+    task_definition: str,
+    request_settings: dict,
+    debug: bool = False,
 ) -> str:
-    """Queries the HTML content using the provided query engine and task definition, then cleans the response."""
-    relevant_parts = query_engine.retriever.retrieve(task_definition)
-    response = query_engine.query(task_definition)
+    """Cleans the synthesized response and saves debug information if requested."""
     cleaned_response = clean_html(str(response))
 
     if debug:
@@ -1,17 +1,15 @@
 import os
+import sys
+import threading
 import numpy as np
-from scipy.spatial.distance import cdist
 
 from llama_index.core import (
     Document,
-    VectorStoreIndex,
     get_response_synthesizer,
     PromptTemplate,
     Settings,
 )
-from llama_index.core.node_parser import CodeSplitter
 from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.retrievers.bm25 import BM25Retriever
 
 from wcg.utils.prompts import (
     selenium_few_shot,
@@ -20,6 +18,23 @@ from wcg.utils.prompts import (
     plain_js_few_shot,
 )
 from wcg.ai.ai_core import LLMFactory, EmbeddingFactory
+from wcg.ai.embeddings import EmbeddingService, EmbeddingMatrix, EMBED_DTYPE
+from wcg.ai.embedding_cache import get_embedding_cache
+from wcg.utils.cache import LRUCache, content_hash
+from wcg.utils.singleflight import BlockingSingleFlight
+from wcg.utils.metrics import CHUNKS, observe_cache, observe_stage, record, span
+from wcg.utils.few_shot import get_few_shot_matrix, select_few_shot_indices
+from wcg.utils.prompt_builder import pack_to_budget, token_budget, FEW_SHOT_BUDGET_SHARE
+from wcg.utils.chunking import (
+    MAX_CHUNK_CHARS,
+    prepare_chunks,
+)
+from wcg.utils.retrievers import (
+    BM25CorpusRetriever,
+    DenseMatrixRetriever,
+    HybridRetriever,
+    normalize_rows,
+)
 
 # Setup logging
 import logging
@@ -30,15 +45,23 @@ logger = logging.getLogger(__name__)
 # Global variables to store initialized models
 EMBEDDING_MODEL_CACHE = {}
 LLM_MODEL_CACHE = {}
+INDEX_CACHE = LRUCache(
+    max_entries=int(os.environ.get("WCG_INDEX_CACHE_SIZE", 16)),
+    max_bytes=int(os.environ.get("WCG_INDEX_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    sizeof=lambda entry: entry.nbytes,
+)
+INDEX_BUILDS = BlockingSingleFlight()
 
 
 def get_cache(cache_name: str):
     """Access a named cache, initializing it if necessary."""
-    global EMBEDDING_MODEL_CACHE, LLM_MODEL_CACHE
+    global EMBEDDING_MODEL_CACHE, LLM_MODEL_CACHE, INDEX_CACHE
     if cache_name == "embedding":
         return EMBEDDING_MODEL_CACHE
     elif cache_name == "llm":
         return LLM_MODEL_CACHE
+    elif cache_name == "index":
+        return INDEX_CACHE
     else:
         logger.error(f"Unknown cache name: {cache_name}")
         return None
@@ -62,54 +85,312 @@ def get_or_create_embedding_model(model_name: str):
     return cache[model_name]
 
 
+def resolve_embed_model(use_local_embeddings: bool, model_name: str):
+    """Returns the local embedding model or the globally configured default."""
+    if use_local_embeddings:
+        return get_or_create_embedding_model(model_name)
+    return Settings.embed_model
+
+
 def get_or_create_llm(api_key: str, model: str, llm_type: str):
     """Retrieve or create an LLM based on the type and model."""
     cache = get_cache("llm")
     cache_key = f"{llm_type}_{model}"
-    logger.info(f"LLM cache before: {cache}")
     if cache_key not in cache:
         llm_factory = LLMFactory()
         cache[cache_key] = llm_factory.create_llm(
             api_key=api_key, model=model, llm_type=llm_type
         )
-    logger.info(f"LLM cache: {cache}")
+        logger.debug(f"Created {llm_type} LLM {model}")
     return cache[cache_key]
 
 
-def calculate_chunk_parameters(html_content: str) -> (int, int):
-    """Calculate chunk lines and overlap based on HTML content."""
-    average_paragraph_length = sum(len(p) for p in html_content.split("</p>")) / max(
-        1, html_content.count("</p>")
+# Memory of an empty str object; each ASCII character adds one byte.
+STR_OVERHEAD = sys.getsizeof("")
+
+
+def corpus_nbytes(corpus: list) -> int:
+    """Estimates the memory held by a list of token lists."""
+    return sys.getsizeof(corpus) + sum(
+        sys.getsizeof(tokens) + STR_OVERHEAD * len(tokens) + sum(map(len, tokens))
+        for tokens in corpus
     )
-    chunk_lines = max(40, int(average_paragraph_length / 40))
-    chunk_lines_overlap = int(chunk_lines * 0.25)
-    return chunk_lines, chunk_lines_overlap
 
 
-def create_index(
+class IndexEntry:
+    """Split nodes of a page together with the retrieval structures built over them.
+
+    Only the nodes and their tokenized corpus are built eagerly; the BM25
+    statistics and chunk embedding matrices are created the first time a
+    retriever that needs them is requested.
+    """
+
+    def __init__(self, nodes: list, corpus: list):
+        self.nodes = nodes
+        # Key of the entry in the index cache, to re-store it when it grows.
+        self.cache_key = None
+        self._text_bytes = sum(len(node.text) for node in nodes)
+        self._corpus = corpus
+        self._corpus_bytes = corpus_nbytes(corpus) if corpus is not None else 0
+        self._bm25_retriever = None
+        self._embedding_matrices = {}
+        # Embedding rows carried over from a previous version of the page, per
+        # model: (EmbeddingMatrix of those rows, their positions in nodes).
+        self._seed_rows = {}
+        # How much of a previous version was reused, for incremental builds.
+        self.reuse = None
+        # Separate locks, so BM25 queries do not wait behind a page being embedded.
+        self._bm25_lock = threading.Lock()
+        self._embedding_lock = threading.Lock()
+
+    @classmethod
+    def from_payload(
+        cls, payload: dict, previous: "IndexEntry" = None
+    ) -> "IndexEntry":
+        """Builds an entry from the chunk payload produced by prepare_chunks.
+
+        Given the entry of a previous version of the page, nodes and embedding
+        rows of unchanged chunks are carried over instead of being rebuilt.
+        """
+        if previous is None:
+            nodes = [Document(text=chunk) for chunk in payload["chunks"]]
+            return cls(nodes, payload["corpus"])
+
+        previous_positions = {node.text: i for i, node in enumerate(previous.nodes)}
+        nodes = []
+        reused = []
+        for position, chunk in enumerate(payload["chunks"]):
+            previous_position = previous_positions.get(chunk)
+            if previous_position is None:
+                nodes.append(Document(text=chunk))
+            else:
+                nodes.append(previous.nodes[previous_position])
+                reused.append((position, previous_position))
+        entry = cls(nodes, payload["corpus"])
+        entry._seed_rows = previous.embedding_rows([old for _, old in reused])
+        entry._seed_rows = {
+            key: (rows, np.array([new for new, _ in reused], dtype=np.intp))
+            for key, rows in entry._seed_rows.items()
+        }
+        entry.reuse = {
+            "chunks": len(nodes),
+            "reused_chunks": len(reused),
+            "reuse_ratio": round(len(reused) / len(nodes), 4) if nodes else 0.0,
+        }
+        return entry
+
+    @property
+    def nbytes(self) -> int:
+        """Chunk text and tokens plus the BM25 index and embedding matrices built so far."""
+        nbytes = self._text_bytes
+        if self._corpus is not None:
+            nbytes += self._corpus_bytes
+        retriever = self._bm25_retriever
+        if retriever is not None and retriever.bm25 is not None:
+            nbytes += retriever.bm25.nbytes
+        for matrix in list(self._embedding_matrices.values()):
+            nbytes += matrix.nbytes
+        for rows, _ in list(self._seed_rows.values()):
+            nbytes += rows.nbytes
+        return nbytes
+
+    def _recharge(self):
+        # Re-storing the entry makes the cache re-measure it against its byte cap.
+        cache = get_cache("index")
+        if self.cache_key is not None and self.cache_key in cache:
+            cache.put(self.cache_key, self)
+
+    def chunk_terms(self) -> dict:
+        """Returns {chunk text: BM25 tokens} for reuse by a new version of the page."""
+        with self._bm25_lock:
+            if self._corpus is not None:
+                return {
+                    node.text: tokens for node, tokens in zip(self.nodes, self._corpus)
+                }
+            if self._bm25_retriever is None or self._bm25_retriever.bm25 is None:
+                return {}
+            return {
+                node.text: terms
+                for node, terms in zip(
+                    self.nodes, self._bm25_retriever.bm25.documents()
+                )
+            }
+
+    def embedding_rows(self, positions: list) -> dict:
+        """Returns {model: EmbeddingMatrix} with the given rows of every embedded matrix."""
+        if not positions:
+            return {}
+        positions = np.asarray(positions, dtype=np.intp)
+        with self._embedding_lock:
+            return {
+                key: EmbeddingMatrix(matrix.data[positions], matrix.scale)
+                for key, matrix in self._embedding_matrices.items()
+            }
+
+    def bm25_retriever(self, top_k: int) -> BM25CorpusRetriever:
+        """Returns a BM25 retriever over the cached corpus with the given top_k."""
+        if self._bm25_retriever is not None:
+            return self._bm25_retriever.with_top_k(top_k)
+        built = False
+        with self._bm25_lock:
+            if self._bm25_retriever is None:
+                with span("bm25_build"):
+                    self._bm25_retriever = BM25CorpusRetriever(
+                        self.nodes, self._corpus, similarity_top_k=top_k
+                    )
+                self._corpus = None
+                built = True
+        if built:
+            self._recharge()
+        return self._bm25_retriever.with_top_k(top_k)
+
+    def embedding_matrix(self, embed_model, embed_model_name: str) -> EmbeddingMatrix:
+        """Returns the normalized chunk embedding matrix, embedding chunks once."""
+        matrix = self._embedding_matrices.get(embed_model_name)
+        if matrix is not None:
+            return matrix
+        built = False
+        with self._embedding_lock:
+            if embed_model_name not in self._embedding_matrices:
+                with span("embedding"):
+                    self._embedding_matrices[embed_model_name] = self._embed_chunks(
+                        embed_model, embed_model_name
+                    )
+                built = True
+            matrix = self._embedding_matrices[embed_model_name]
+        if built:
+            self._recharge()
+        return matrix
+
+    def _embed_chunks(self, embed_model, embed_model_name: str) -> EmbeddingMatrix:
+        service = EmbeddingService(
+            embed_model, model_name=embed_model_name, cache=get_embedding_cache()
+        )
+        texts = [node.text for node in self.nodes]
+        seed = self._seed_rows.pop(embed_model_name, None)
+        if seed is None:
+            return EmbeddingMatrix.from_float(
+                normalize_rows(service.embed_texts(texts)), EMBED_DTYPE
+            )
+        rows, seeded = seed
+        missing = np.setdiff1d(np.arange(len(texts)), seeded)
+        data = np.empty((len(texts), rows.data.shape[1]), dtype=rows.data.dtype)
+        data[seeded] = rows.data
+        if len(missing):
+            embeddings = service.embed_texts([texts[i] for i in missing])
+            data[missing] = EmbeddingMatrix.from_float(
+                normalize_rows(embeddings), EMBED_DTYPE
+            ).data
+        self.reuse["reused_embeddings"] = len(seeded)
+        return EmbeddingMatrix(data, rows.scale)
+
+    def dense_retriever(
+        self, top_k: int, use_local_embeddings: bool, embed_model_name: str
+    ) -> DenseMatrixRetriever:
+        """Returns a cosine-similarity retriever over the chunk embedding matrix."""
+        embed_model = resolve_embed_model(use_local_embeddings, embed_model_name)
+        matrix_key = (
+            embed_model_name
+            if use_local_embeddings
+            else getattr(embed_model, "model_name", "default")
+        )
+        return DenseMatrixRetriever(
+            self.nodes,
+            self.embedding_matrix(embed_model, matrix_key),
+            embed_model,
+            similarity_top_k=top_k,
+        )
+
+    def retriever(
+        self,
+        top_k: int,
+        retriever_mode: str = "bm25",
+        use_local_embeddings: bool = False,
+        embed_model_name: str = "BAAI/bge-small-en-v1.5",
+    ):
+        """Returns a retriever for the requested mode, computing dense vectors only if needed."""
+        if retriever_mode == "bm25":
+            return self.bm25_retriever(top_k)
+        elif retriever_mode == "dense":
+            return self.dense_retriever(top_k, use_local_embeddings, embed_model_name)
+        elif retriever_mode == "hybrid":
+            return HybridRetriever(
+                self.bm25_retriever(top_k),
+                self.dense_retriever(top_k, use_local_embeddings, embed_model_name),
+                similarity_top_k=top_k,
+            )
+        raise ValueError(f"Unknown retriever mode: {retriever_mode}")
+
+
+def index_cache_key(
+    html_content: str, prune: bool = True, chunking: str = "lines"
+) -> str:
+    """Builds the content-addressed cache key for an indexed page.
+
+    Chunk sizes are derived from the content itself, so only the settings that
+    change the chunking outcome are added to the hash.
+    """
+    return content_hash(html_content, prune, chunking, MAX_CHUNK_CHARS)
+
+
+def get_or_create_index_entry(
     html_content: str,
-    use_local_embeddings: bool = False,
-    embed_model_name: str = "BAAI/bge-small-en-v1.5",
-) -> VectorStoreIndex:
-    """Creates a VectorStoreIndex from HTML content, optionally using local embeddings."""
-    chunk_lines, chunk_lines_overlap = calculate_chunk_parameters(html_content)
-
-    splitter = CodeSplitter(
-        language="html",
-        chunk_lines=chunk_lines,
-        chunk_lines_overlap=chunk_lines_overlap,
-        max_chars=2000,
-    )
-    chunks = splitter.split_text(html_content)
-    nodes = [Document(text=chunk) for chunk in chunks if chunk.strip()]
+    prune: bool = True,
+    chunking: str = "lines",
+    previous: IndexEntry = None,
+) -> IndexEntry:
+    """Retrieve the indexed page from the LRU cache or chunk it into a new entry.
+
+    When the entry of a previous version of the page (indexed with the same
+    settings) is given, only chunks that changed are tokenized and embedded.
+    """
+    cache = get_cache("index")
+    cache_key = index_cache_key(html_content, prune, chunking)
+    entry = cache.get(cache_key)
+    observe_cache("index", entry is not None)
+    if entry is None:
+        # Concurrent misses for the same page wait for a single build.
+        entry, _ = INDEX_BUILDS.do(
+            cache_key, _build_index_entry, cache_key, html_content, prune, chunking, previous
+        )
+    logger.debug(f"Index cache stats: {cache.stats()}")
+    return entry
 
-    if use_local_embeddings:
-        embed_model = get_or_create_embedding_model(embed_model_name)
-        Settings.embed_model = embed_model
-    else:
-        embed_model = None
 
-    return VectorStoreIndex(nodes, embedding_model=embed_model)
+def _build_index_entry(
+    cache_key: str,
+    html_content: str,
+    prune: bool,
+    chunking: str,
+    previous: IndexEntry = None,
+) -> IndexEntry:
+    # A build that finished just before this one was requested is reused.
+    if cache_key in get_cache("index"):
+        entry = get_cache("index").get(cache_key)
+        if entry is not None:
+            return entry
+    known_terms = previous.chunk_terms() if previous is not None else None
+    with span("index_build"):
+        payload = prepare_chunks(html_content, prune, chunking, known_terms)
+        entry = IndexEntry.from_payload(payload, previous)
+    if entry.reuse is not None:
+        logger.info(
+            f"Reused {entry.reuse['reused_chunks']} of {entry.reuse['chunks']} "
+            "chunks from the previous version of the page"
+        )
+    for stage, seconds in payload["timings"].items():
+        observe_stage(stage, seconds)
+    CHUNKS.observe("page", len(entry.nodes))
+    record("page_chunks", len(entry.nodes))
+    if payload["prune_stats"]:
+        stats = payload["prune_stats"]
+        logger.info(
+            f"Pruned HTML from {stats['bytes_in']} to {stats['bytes_out']} bytes "
+            f"({stats['reduction']:.0%} reduction)"
+        )
+    entry.cache_key = cache_key
+    get_cache("index").put(cache_key, entry)
+    return entry
 
 
 def prepare_prompt_template(prompt_template: str):
@@ -133,14 +414,23 @@ def get_query_engine(
     llm_type: str = "openai",
     llm_model: str = "gpt-3.5-turbo",
     query: str = None,
+    retriever_mode: str = "bm25",
+    prune_html: bool = True,
+    chunking: str = "lines",
+    index_entry: IndexEntry = None,
 ) -> RetrieverQueryEngine:
-    """Configures and returns a RetrieverQueryEngine for querying HTML content."""
+    """Configures and returns a RetrieverQueryEngine for querying HTML content.
+
+    An already built index_entry, e.g. of an uploaded page, skips the index cache.
+    """
     embed_model = (
         get_or_create_embedding_model(model_name) if use_local_embeddings else None
     )
-    index = create_index(html_content, use_local_embeddings, model_name)
+    entry = index_entry or get_or_create_index_entry(
+        html_content, prune_html, chunking
+    )
 
-    retriever = BM25Retriever.from_defaults(index=index, similarity_top_k=top_k)
+    retriever = entry.retriever(top_k, retriever_mode, use_local_embeddings, model_name)
     api_key = api_key_finder(llm_type)
 
     llm = get_or_create_llm(api_key=api_key, model=llm_model, llm_type=llm_type)
@@ -152,27 +442,30 @@ def get_query_engine(
             prompt_template
         )
 
-        few_shot_queries = [example["query"] for example in few_shot_examples]
-
-        query_embedding = (
-            embed_model.get_query_embedding(query) if embed_model else None
-        )
-
-        few_shot_embeddings = (
-            [embed_model.get_query_embedding(q) for q in few_shot_queries]
-            if embed_model
-            else []
-        )
-
-        distances = (
-            cdist([query_embedding], few_shot_embeddings, metric="cosine")[0]
-            if embed_model
-            else []
-        )
-        closest_indices = np.argsort(distances)[:top_k] if embed_model else []
-
+        with span("few_shot"):
+            if embed_model:
+                few_shot_matrix = get_few_shot_matrix(
+                    embed_model,
+                    model_name,
+                    "selenium" if prompt_template == "selenium" else "js",
+                    few_shot_examples,
+                )
+                query_embedding = embed_model.get_query_embedding(query)
+                closest_indices = select_few_shot_indices(
+                    query_embedding, few_shot_matrix, top_k
+                )
+            else:
+                closest_indices = []
+
+            # Keep the closest examples that fit the few-shot share of the token budget.
+            packed_positions, _ = pack_to_budget(
+                [few_shot_examples[index]["example"] for index in closest_indices],
+                int(token_budget(llm_model) * FEW_SHOT_BUDGET_SHARE),
+                llm_model,
+            )
         updated_few_shot_examples = [
-            few_shot_examples[index] for index in closest_indices
+            few_shot_examples[closest_indices[position]]
+            for position in packed_positions
         ]
 
         reduced_few_shot_examples = [
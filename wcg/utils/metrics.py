@@ -0,0 +1,204 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from sub-millisecond parsing to slow LLM calls.
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000)
+
+# Per-request record of stage timings and sizes, set by start_trace.
+_trace = ContextVar("wcg_trace", default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one label."""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for label_value, (counts, total) in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(
+                        f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                    )
+                cumulative += counts[-1]
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{label}}} {total}")
+                lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style counter with two labels."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = ",".join(
+                    f'{label}="{label_value}"'
+                    for label, label_value in zip(self.labels, label_values)
+                )
+                lines.append(f"{self.name}_total{{{labels}}} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "wcg_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    "stage",
+    LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "wcg_request_duration_seconds",
+    "End-to-end request latency per endpoint.",
+    "endpoint",
+    LATENCY_BUCKETS,
+)
+CHUNKS = Histogram(
+    "wcg_chunks",
+    "Chunks per indexed page, and retrieved and prompted chunks per query.",
+    "kind",
+    COUNT_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "wcg_prompt_tokens",
+    "Prompt tokens sent to the LLM.",
+    "model",
+    TOKEN_BUCKETS,
+)
+CACHE_EVENTS = Counter(
+    "wcg_cache_events",
+    "Cache lookups by cache and outcome.",
+    ("cache", "outcome"),
+)
+SERVED_BY = Counter(
+    "wcg_served",
+    "Extractions by the path that produced them.",
+    ("path", "extractor"),
+)
+
+METRICS = (
+    STAGE_SECONDS,
+    REQUEST_SECONDS,
+    CHUNKS,
+    PROMPT_TOKENS,
+    CACHE_EVENTS,
+    SERVED_BY,
+)
+
+
+def start_trace() -> dict:
+    """Starts recording stage timings for the current request and returns the record."""
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+
+def record(name: str, value):
+    """Adds a value to the current request's trace, if one is being recorded."""
+    trace = _trace.get()
+    if trace is not None:
+        trace[name] = value
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(stage, seconds)
+    trace = _trace.get()
+    if trace is not None:
+        timings = trace.setdefault("timings", {})
+        # Stages that run more than once per request add up.
+        timings[stage] = round(timings.get(stage, 0.0) + seconds, 6)
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def request_span(endpoint: str):
+    """Times a whole request and records the total in its trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        REQUEST_SECONDS.observe(endpoint, seconds)
+        record("total_seconds", round(seconds, 6))
+
+
+def observe_cache(cache: str, hit: bool):
+    outcome = "hit" if hit else "miss"
+    CACHE_EVENTS.inc(cache, outcome)
+    record(f"{cache}_cache", outcome)
+
+
+def render_metrics() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
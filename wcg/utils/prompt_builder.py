@@ -0,0 +1,96 @@
+import os
+import json
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets per LLM; the rest of the context window is left for the completion.
+MODEL_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 12000,
+    "gpt-4": 6000,
+    "meta-llama/Llama-3-8b-chat-hf": 6000,
+    "meta-llama/Llama-3-70b-chat-hf": 6000,
+}
+MODEL_TOKEN_BUDGETS.update(
+    json.loads(os.environ.get("WCG_PROMPT_TOKEN_BUDGETS", "{}"))
+)
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("WCG_DEFAULT_PROMPT_TOKEN_BUDGET", 6000))
+
+# Share of the budget few-shot examples may take; retrieved chunks get the rest.
+FEW_SHOT_BUDGET_SHARE = float(os.environ.get("WCG_FEW_SHOT_BUDGET_SHARE", 0.4))
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its vocabularies on first use, which fails offline.
+        logger.warning(f"Falling back to estimated token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Counts tokens with tiktoken, or estimates four characters per token without it."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def token_budget(model: str) -> int:
+    """Returns the prompt token budget configured for the model."""
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+def pack_to_budget(
+    texts: list, budget: int, model: str = "gpt-3.5-turbo"
+) -> (list, int):
+    """Greedily selects texts in the given (best-first) order while they fit the budget.
+
+    Returns the selected indices and the number of tokens they use. Texts that do
+    not fit are skipped so smaller, lower-ranked ones can still be included.
+    """
+    selected = []
+    used = 0
+    for index, text in enumerate(texts):
+        tokens = count_tokens(text, model)
+        if used + tokens <= budget:
+            selected.append(index)
+            used += tokens
+    return selected, used
+
+
+def pack_relevant_parts(
+    prompt_template: str, task_definition: str, relevant_parts: list, model: str
+) -> (list, int):
+    """Keeps the highest scoring retrieved nodes that fit next to the prompt template.
+
+    Returns the kept nodes and the total prompt token count.
+    """
+    fixed_tokens = count_tokens(prompt_template, model) + count_tokens(
+        task_definition, model
+    )
+    ranked = sorted(relevant_parts, key=lambda part: part.score or 0.0, reverse=True)
+    selected, used = pack_to_budget(
+        [part.node.get_content() for part in ranked],
+        max(0, token_budget(model) - fixed_tokens),
+        model,
+    )
+    if len(selected) < len(ranked):
+        logger.info(
+            f"Packed {len(selected)} of {len(ranked)} retrieved chunks into the "
+            f"{token_budget(model)} token budget for {model}"
+        )
+    return [ranked[index] for index in selected], fixed_tokens + used
@@ -0,0 +1,160 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+
+# Subtrees that never contain elements the Selenium/JS prompts can target.
+DROPPED_TAGS = {
+    "script",
+    "style",
+    "svg",
+    "noscript",
+    "template",
+    "canvas",
+    "object",
+    "math",
+}
+# Void elements that carry no useful content.
+DROPPED_VOID_TAGS = {"meta", "link", "base", "source", "track", "wbr", "col", "param"}
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+}
+INLINE_TAGS = {
+    "a",
+    "abbr",
+    "b",
+    "em",
+    "i",
+    "label",
+    "small",
+    "span",
+    "strong",
+    "sub",
+    "sup",
+}
+
+# Attributes the prompts rely on for targeting elements.
+KEPT_ATTRIBUTES = {
+    "id",
+    "class",
+    "name",
+    "type",
+    "value",
+    "placeholder",
+    "href",
+    "src",
+    "alt",
+    "title",
+    "role",
+    "for",
+    "action",
+    "method",
+    "checked",
+    "selected",
+    "disabled",
+    "data-testid",
+}
+MAX_ATTRIBUTE_CHARS = 200
+
+whitespace_re = re.compile(r"\s+")
+
+
+class StreamingHTMLPruner(HTMLParser):
+    """Incrementally re-serializes HTML, dropping non-interactive subtrees and bulky attributes."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts = []
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in DROPPED_TAGS:
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        if tag in DROPPED_VOID_TAGS:
+            return
+        if tag not in INLINE_TAGS:
+            self._parts.append("\n")
+        self._parts.append(f"<{tag}{self._format_attributes(attrs)}>")
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skip_tag is not None or tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in VOID_TAGS or tag in DROPPED_TAGS:
+            return
+        self._parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self._skip_tag is not None:
+            return
+        text = whitespace_re.sub(" ", data)
+        if text.strip():
+            self._parts.append(escape(text, quote=False))
+
+    def drain(self) -> str:
+        """Returns and clears the output produced so far."""
+        output = "".join(self._parts)
+        self._parts = []
+        return output
+
+    @staticmethod
+    def _format_attributes(attrs) -> str:
+        formatted = []
+        for name, value in attrs:
+            if name not in KEPT_ATTRIBUTES and not name.startswith("aria-"):
+                continue
+            if value is None:
+                formatted.append(f" {name}")
+                continue
+            if value.startswith("data:") or len(value) > MAX_ATTRIBUTE_CHARS:
+                continue
+            formatted.append(f' {name}="{escape(value, quote=True)}"')
+        return "".join(formatted)
+
+
+def prune_html(html_content: str, chunk_size: int = 64 * 1024) -> (str, dict):
+    """Prunes HTML in fixed-size pieces and reports bytes in and out."""
+    pruner = StreamingHTMLPruner()
+    output = []
+    for start in range(0, len(html_content), chunk_size):
+        pruner.feed(html_content[start : start + chunk_size])
+        output.append(pruner.drain())
+    pruner.close()
+    output.append(pruner.drain())
+    pruned = "".join(output).strip()
+
+    bytes_in = len(html_content.encode("utf-8"))
+    bytes_out = len(pruned.encode("utf-8"))
+    stats = {
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "reduction": 1 - bytes_out / bytes_in if bytes_in else 0.0,
+    }
+    return pruned, stats
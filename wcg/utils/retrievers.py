@@ -0,0 +1,174 @@
+import copy
+import numpy as np
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from wcg.ai.embeddings import EmbeddingService
+from wcg.utils.bm25 import BM25Index
+from wcg.utils.tokenizer import tokenize_query
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a contiguous float32 copy of matrix with unit-length rows."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_k_nodes(nodes: list, scores: np.ndarray, top_k: int) -> list:
+    """Wraps the top_k highest scoring nodes in NodeWithScore, best first."""
+    top_indices = np.argsort(-scores, kind="stable")[:top_k]
+    return [NodeWithScore(node=nodes[i], score=float(scores[i])) for i in top_indices]
+
+
+class TopKMixin:
+    def with_top_k(self, top_k: int):
+        """Returns a copy sharing the scoring state but with a different top_k."""
+        retriever = copy.copy(self)
+        retriever._similarity_top_k = top_k
+        return retriever
+
+    def batch_scores(self, query_strs: list) -> np.ndarray:
+        """Returns a (queries x nodes) score array; subclasses score all queries at once."""
+        return np.vstack([self.scores(query_str) for query_str in query_strs])
+
+    def retrieve_many(self, query_strs: list) -> list:
+        """Retrieves the top_k nodes for each of several queries, in order."""
+        if not query_strs:
+            return []
+        return [
+            top_k_nodes(self._nodes, scores, self._similarity_top_k)
+            for scores in self.batch_scores(query_strs)
+        ]
+
+
+class BM25CorpusRetriever(TopKMixin, BaseRetriever):
+    """BM25 retriever over a pre-tokenized corpus, e.g. one built in a worker process."""
+
+    def __init__(
+        self,
+        nodes: list,
+        corpus: list,
+        similarity_top_k: int = 10,
+        tokenizer=None,
+    ):
+        self._nodes = nodes
+        self._tokenizer = tokenizer or tokenize_query
+        self._similarity_top_k = similarity_top_k
+        self.bm25 = BM25Index(corpus) if corpus else None
+        super().__init__()
+
+    def scores(self, query_str: str) -> np.ndarray:
+        """Returns the BM25 score of every node for the query."""
+        return self.batch_scores([query_str])[0]
+
+    def batch_scores(self, query_strs: list) -> np.ndarray:
+        if self.bm25 is None:
+            return np.zeros((len(query_strs), len(self._nodes)), dtype=np.float32)
+        return self.bm25.get_batch_scores(
+            [self._tokenizer(query_str) for query_str in query_strs]
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        return top_k_nodes(
+            self._nodes, self.scores(query_bundle.query_str), self._similarity_top_k
+        )
+
+
+class DenseMatrixRetriever(TopKMixin, BaseRetriever):
+    """Cosine-similarity retriever over a row-normalized float32 embedding matrix."""
+
+    def __init__(
+        self, nodes: list, matrix: np.ndarray, embed_model, similarity_top_k: int = 10
+    ):
+        self._nodes = nodes
+        self._matrix = matrix
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def scores(self, query_str: str) -> np.ndarray:
+        """Returns the cosine similarity of every node to the query in one mat-vec."""
+        if not len(self._nodes):
+            return np.zeros(0, dtype=np.float32)
+        query_vector = normalize_rows(
+            [self._embed_model.get_query_embedding(query_str)]
+        )[0]
+        return self._matrix @ query_vector
+
+    def batch_scores(self, query_strs: list) -> np.ndarray:
+        if not len(self._nodes):
+            return np.zeros((len(query_strs), 0), dtype=np.float32)
+        # One batched forward pass for all queries instead of one per query.
+        query_matrix = normalize_rows(
+            EmbeddingService(self._embed_model).embed_queries(query_strs)
+        )
+        return (self._matrix @ query_matrix.T).T
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        return top_k_nodes(
+            self._nodes, self.scores(query_bundle.query_str), self._similarity_top_k
+        )
+
+
+def reciprocal_rank_fusion(score_lists: list, k: int = 60) -> np.ndarray:
+    """Fuses several score arrays over the same nodes by reciprocal rank.
+
+    Tied scores share the best of their ranks, so nodes a retriever cannot tell
+    apart, such as chunks without any BM25 term, are not ordered by position.
+    """
+    fused = None
+    for scores in score_lists:
+        ordered = np.sort(-scores)
+        ranks = np.searchsorted(ordered, -scores, side="left").astype(np.float32)
+        contribution = 1.0 / (k + ranks + 1)
+        fused = contribution if fused is None else fused + contribution
+    return fused
+
+
+class HybridRetriever(TopKMixin, BaseRetriever):
+    """Combines BM25 and dense rankings with reciprocal-rank fusion."""
+
+    def __init__(
+        self,
+        bm25_retriever: BM25CorpusRetriever,
+        dense_retriever: DenseMatrixRetriever,
+        similarity_top_k: int = 10,
+        rrf_k: int = 60,
+    ):
+        self._bm25_retriever = bm25_retriever
+        self._dense_retriever = dense_retriever
+        self._nodes = bm25_retriever._nodes
+        self._similarity_top_k = similarity_top_k
+        self._rrf_k = rrf_k
+        super().__init__()
+
+    def scores(self, query_str: str) -> np.ndarray:
+        """Returns the fused score of every node for the query."""
+        return reciprocal_rank_fusion(
+            [
+                self._bm25_retriever.scores(query_str),
+                self._dense_retriever.scores(query_str),
+            ],
+            self._rrf_k,
+        )
+
+    def batch_scores(self, query_strs: list) -> np.ndarray:
+        return np.vstack(
+            [
+                reciprocal_rank_fusion([bm25_scores, dense_scores], self._rrf_k)
+                for bm25_scores, dense_scores in zip(
+                    self._bm25_retriever.batch_scores(query_strs),
+                    self._dense_retriever.batch_scores(query_strs),
+                )
+            ]
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        if not len(self._nodes):
+            return []
+        return top_k_nodes(
+            self._nodes, self.scores(query_bundle.query_str), self._similarity_top_k
+        )
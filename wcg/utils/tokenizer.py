@@ -0,0 +1,246 @@
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+from nltk.stem import PorterStemmer
+from llama_index.core.utils import globals_helper
+
+# Character n-gram size for matching misspelled query terms; 0 turns it off.
+TYPO_NGRAM = int(os.environ.get("WCG_TYPO_NGRAM", 3))
+# A known term replaces an unknown one only if their n-gram Jaccard similarity
+# is above this; at 0.5 "model" would still become "mode".
+TYPO_MIN_SIMILARITY = float(os.environ.get("WCG_TYPO_MIN_SIMILARITY", 0.55))
+# Most characters a replacement may be longer or shorter than the unknown term.
+TYPO_MAX_LENGTH_DIFFERENCE = 2
+# Shorter terms have too few n-grams to be corrected reliably.
+TYPO_MIN_TERM_CHARS = 4
+
+# Tag names become words only for elements a query can refer to.
+TAG_TERMS = {
+    "a": "link",
+    "button": "button",
+    "input": "input",
+    "select": "select",
+    "textarea": "textarea",
+    "img": "image",
+}
+# Words that are noise on web pages: URL parts, entities, units and layout or
+# utility class names. Tag and attribute names are removed before this applies.
+HTML_STOP_WORDS = {
+    "http",
+    "https",
+    "www",
+    "com",
+    "org",
+    "net",
+    "html",
+    "htm",
+    "php",
+    "js",
+    "css",
+    "png",
+    "jpg",
+    "jpeg",
+    "gif",
+    "webp",
+    "svg",
+    "nbsp",
+    "amp",
+    "quot",
+    "lt",
+    "gt",
+    "px",
+    "em",
+    "rem",
+    "vh",
+    "vw",
+    "true",
+    "false",
+    "null",
+    "none",
+    "auto",
+    "blank",
+    "noopener",
+    "noreferrer",
+    "nofollow",
+    "div",
+    "span",
+    "flex",
+    "grid",
+    "col",
+    "row",
+    "wrapper",
+    "container",
+    "inner",
+    "sm",
+    "md",
+    "lg",
+    "xl",
+    "hover",
+    "focus",
+    "group",
+    "dark",
+    "gray",
+    "grey",
+    "white",
+    "black",
+    "text",
+    "font",
+    "bold",
+    "semibold",
+    "medium",
+    "block",
+    "inline",
+    "center",
+    "relative",
+    "absolute",
+    "rounded",
+    "border",
+    "bg",
+    "shadow",
+    "truncate",
+    "overflow",
+    "items",
+    "justify",
+    "gap",
+    "mt",
+    "mb",
+    "ml",
+    "mr",
+    "mx",
+    "my",
+    "pt",
+    "pb",
+    "pl",
+    "pr",
+    "py",
+    "min",
+    "max",
+    "leading",
+    "tracking",
+    "decoration",
+    "underline",
+    "opacity",
+    "transition",
+    "duration",
+}
+# Instruction words that say what to do, not which element to do it on.
+QUERY_STOP_WORDS = {
+    "click",
+    "press",
+    "tap",
+    "go",
+    "navigate",
+    "type",
+    "enter",
+    "write",
+    "word",
+    "please",
+}
+
+tag_re = re.compile(r"<(/?)([A-Za-z][\w-]*)")
+attribute_name_re = re.compile(r"[\w:.-]+\s*=\s*(?=[\"'])")
+# Letter and digit runs; hyphens, underscores and dots separate words, so class
+# names and attribute values like "nav-search_input" split apart.
+word_re = re.compile(r"[^\W_]+")
+# Parts of a camelCase identifier: "searchBarHTML2" -> search, Bar, HTML, 2.
+identifier_part_re = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+_stemmer = PorterStemmer()
+
+
+def _replace_tag(match) -> str:
+    if match.group(1):
+        return " "
+    return f" {TAG_TERMS.get(match.group(2).lower(), '')} "
+
+
+def strip_markup(text: str) -> str:
+    """Removes tag and attribute names, keeping text and attribute values."""
+    return attribute_name_re.sub(" ", tag_re.sub(_replace_tag, text))
+
+
+@lru_cache(maxsize=65536)
+def word_terms(word: str) -> tuple:
+    """Returns the stemmed terms of one word: itself and, for identifiers, its parts."""
+    parts = identifier_part_re.findall(word) if word.isascii() else [word]
+    words = [word] if len(parts) <= 1 else [word, *parts]
+    terms = []
+    for candidate in words:
+        candidate = candidate.lower()
+        if len(candidate) < 2 and not candidate.isdigit():
+            continue
+        if (
+            candidate not in globals_helper.stopwords
+            and candidate not in HTML_STOP_WORDS
+        ):
+            terms.append(_stemmer.stem(candidate))
+    return tuple(terms)
+
+
+def tokenize_html(text: str) -> list:
+    """Splits an HTML chunk into stemmed BM25 terms, keeping repeats."""
+    terms = []
+    for word in word_re.findall(strip_markup(text)):
+        terms.extend(word_terms(word))
+    return terms
+
+
+def tokenize_query(query: str) -> list:
+    """Splits a natural-language query into the same terms, minus instruction words."""
+    terms = []
+    for word in word_re.findall(query):
+        if word.lower() not in QUERY_STOP_WORDS:
+            terms.extend(word_terms(word))
+    return terms
+
+
+def char_ngrams(term: str, n: int) -> set:
+    padded = f" {term} "
+    return {padded[i : i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+class TypoMatcher:
+    """Maps terms missing from a vocabulary to the most similar known term.
+
+    Similarity is the Jaccard overlap of character n-grams, looked up through
+    an n-gram to term index, so only terms sharing an n-gram are compared.
+    """
+
+    def __init__(
+        self,
+        vocabulary,
+        n: int = TYPO_NGRAM,
+        min_similarity: float = TYPO_MIN_SIMILARITY,
+    ):
+        self.n = n
+        self.min_similarity = min_similarity
+        self._terms = {}
+        self._ngram_sizes = {}
+        for term in vocabulary:
+            if len(term) < TYPO_MIN_TERM_CHARS:
+                continue
+            ngrams = char_ngrams(term, n)
+            self._ngram_sizes[term] = len(ngrams)
+            for ngram in ngrams:
+                self._terms.setdefault(ngram, []).append(term)
+
+    def match(self, term: str) -> str:
+        """Returns the closest known term, or None if none is similar enough."""
+        if len(term) < TYPO_MIN_TERM_CHARS:
+            return None
+        ngrams = char_ngrams(term, self.n)
+        overlaps = Counter()
+        for ngram in ngrams:
+            overlaps.update(self._terms.get(ngram, ()))
+        best_term, best_similarity = None, self.min_similarity
+        for candidate, overlap in overlaps.items():
+            if abs(len(candidate) - len(term)) > TYPO_MAX_LENGTH_DIFFERENCE:
+                continue
+            similarity = overlap / (
+                len(ngrams) + self._ngram_sizes[candidate] - overlap
+            )
+            if similarity > best_similarity:
+                best_term, best_similarity = candidate, similarity
+        return best_term